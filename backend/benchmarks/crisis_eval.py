@@ -0,0 +1,97 @@
+"""
+Offline evaluation of the local crisis pre-classifier.
+
+Usage (from backend/):
+    python -m benchmarks.crisis_eval [path/to/fixtures.jsonl] [--verbose]
+
+Each fixture line is {"text": "...", "label": "crisis" | "ok"}, optionally with
+"must_reach_llm": true for "ok" messages that must never be marked benign
+(e.g. a bare "goodbye", which can be a warning sign).
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from services.crisis_classifier import prescreen, risk_score, CRISIS, BENIGN  # noqa: E402
+
+DEFAULT_FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "crisis_messages.jsonl")
+
+
+def load_fixtures(path: str) -> list[dict]:
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(fixtures: list[dict], verbose: bool = False) -> dict:
+    escalated_tp = escalated_fp = missed = 0
+    benign_total = benign_wrong = must_reach_llm_skipped = 0
+    uncertain = 0
+
+    start = time.perf_counter()
+    verdicts = [prescreen(item["text"]) for item in fixtures]
+    elapsed = time.perf_counter() - start
+
+    for item, verdict in zip(fixtures, verdicts):
+        is_crisis = item["label"] == "crisis"
+
+        if verdict == CRISIS:
+            if is_crisis:
+                escalated_tp += 1
+            else:
+                escalated_fp += 1
+        elif is_crisis:
+            missed += 1
+
+        if verdict == BENIGN:
+            benign_total += 1
+            if is_crisis:
+                benign_wrong += 1
+            elif item.get("must_reach_llm"):
+                must_reach_llm_skipped += 1
+        elif verdict != CRISIS:
+            uncertain += 1
+
+        if verbose:
+            score, _ = risk_score(item["text"])
+            print(f"{item['label']:>6}  {verdict:<9} {score:4.1f}  {item['text']}")
+
+    total = len(fixtures)
+    positives = sum(1 for item in fixtures if item["label"] == "crisis")
+    escalated = escalated_tp + escalated_fp
+
+    return {
+        "messages": total,
+        "escalation_precision": round(escalated_tp / escalated, 3) if escalated else None,
+        "escalation_recall": round(escalated_tp / positives, 3) if positives else None,
+        # Crisis messages the local layer escalated or passed on to the LLM;
+        # anything marked benign is a miss the LLM never gets to see.
+        "benign_precision": round(1 - benign_wrong / benign_total, 3) if benign_total else None,
+        "unsafe_benign": benign_wrong,
+        "must_reach_llm_skipped": must_reach_llm_skipped,
+        "left_for_llm": uncertain,
+        # Escalations still go to the LLM (it decides crisis flow vs. reply),
+        # so only benign verdicts save a call
+        "llm_calls_saved": benign_total,
+        "llm_calls_saved_pct": round(100 * benign_total / total, 1) if total else 0.0,
+        "us_per_message": round(1e6 * elapsed / total, 1) if total else 0.0,
+    }
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    verbose = "--verbose" in sys.argv
+    path = args[0] if args else DEFAULT_FIXTURES
+
+    report = evaluate(load_fixtures(path), verbose=verbose)
+    print(json.dumps(report, indent=2))
+
+    # Non-zero exit if any crisis (or must-reach-LLM) message would skip the LLM entirely
+    if report["unsafe_benign"] or report["must_reach_llm_skipped"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+Environment for running the app against the local fakes. Kept free of heavy
+imports so benchmarks can set it up before timing `import main`.
+"""
+import os
+
+
+def configure_env(ports: dict, state_dir: str, **overrides: str):
+    """Point every service at the fakes; must run before the app is imported."""
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": "bench-token",
+        "TELEGRAM_API_BASE": f"http://127.0.0.1:{ports['telegram']}",
+        "TELEGRAM_HTTP2": "false",
+        "OPENAI_API_KEY": "bench-key",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{ports['openai']}/v1",
+        "ELEVENLABS_API_KEY": "bench-key",
+        "ELEVENLABS_BASE_URL": f"http://127.0.0.1:{ports['elevenlabs']}",
+        "ELEVENLABS_AGENT_ID": "bench-agent",
+        "STATE_DB": os.path.join(state_dir, "state.db"),
+        "VOICES_DB": os.path.join(state_dir, "voices.db"),
+        "CHECKINS_DB": os.path.join(state_dir, "checkins.db"),
+        "TTS_CACHE_DIR": os.path.join(state_dir, "tts_cache"),
+        "MEDIA_REGISTRY_FILE": os.path.join(state_dir, "media_ids.jsonl"),
+        "AUDIO_LIBRARY_DIR": os.path.join(state_dir, "audio_library"),
+        **overrides,
+    })
@@ -0,0 +1,390 @@
+"""
+Local stand-ins for the Telegram Bot API, OpenAI chat completions and
+ElevenLabs, used by the load test. Each fake has configurable latency,
+error rate and 429 behaviour.
+"""
+import json
+import time
+import struct
+import random
+import asyncio
+import hashlib
+from collections import deque
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+from services.audio import OggPage
+
+
+class FakeConfig:
+    """Latency and failure knobs for one fake upstream."""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: int = 1,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+
+    async def delay(self, scale: float = 1.0):
+        wait = self.latency * scale + random.uniform(0, self.jitter)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def roll(self) -> str | None:
+        """Decide whether this call fails: '429', 'error' or None."""
+        r = random.random()
+        if r < self.rate_limit_rate:
+            return "429"
+        if r < self.rate_limit_rate + self.error_rate:
+            return "error"
+        return None
+
+
+class FakeTelegram:
+    """Bot API subset: getUpdates, sendMessage, sendVoice, sendChatAction, getFile, webhooks."""
+
+    def __init__(self, config: FakeConfig, on_voice=None, on_text=None):
+        self.config = config
+        self.on_voice = on_voice
+        self.on_text = on_text
+
+        self._updates: deque = deque()
+        self._update_event = asyncio.Event()
+        self._next_update_id = 1
+        self._message_id = 0
+        self.stats = {
+            "getUpdates": 0,
+            "sendMessage": 0,
+            "sendVoice": 0,
+            "sendVoice_uploads": 0,
+            "sendVoice_bytes": 0,
+            "429": 0,
+            "errors": 0,
+        }
+        self.app = self._build_app()
+
+    def make_update(self, chat_id: int, text: str, first_name: str = "Bench") -> dict:
+        """Build a message update with the next update_id."""
+        update = {
+            "update_id": self._next_update_id,
+            "message": {
+                "message_id": self._next_update_id,
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "first_name": first_name},
+                "date": int(time.time()),
+                "text": text,
+            },
+        }
+        self._next_update_id += 1
+        return update
+
+    def push_message(self, chat_id: int, text: str, first_name: str = "Bench") -> dict:
+        """Queue an update for getUpdates."""
+        update = self.make_update(chat_id, text, first_name)
+        self._updates.append(update)
+        self._update_event.set()
+        return update
+
+    def _failure(self) -> JSONResponse | None:
+        outcome = self.config.roll()
+        if outcome == "429":
+            self.stats["429"] += 1
+            return JSONResponse(
+                status_code=429,
+                content={
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.config.retry_after}",
+                    "parameters": {"retry_after": self.config.retry_after},
+                },
+            )
+        if outcome == "error":
+            self.stats["errors"] += 1
+            return JSONResponse(
+                status_code=500,
+                content={"ok": False, "error_code": 500, "description": "Internal Server Error"},
+            )
+        return None
+
+    def _message(self, chat_id, **extra) -> dict:
+        self._message_id += 1
+        return {"message_id": self._message_id, "chat": {"id": int(chat_id)}, **extra}
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/bot{token}/getUpdates")
+        async def get_updates(token: str, request: Request):
+            self.stats["getUpdates"] += 1
+            body = await request.json()
+            offset = body.get("offset") or 0
+            timeout = min(float(body.get("timeout", 0)), 30.0)
+
+            while self._updates and self._updates[0]["update_id"] < offset:
+                self._updates.popleft()
+
+            if not self._updates and timeout > 0:
+                self._update_event.clear()
+                try:
+                    await asyncio.wait_for(self._update_event.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch = [u for u in list(self._updates)[:100] if u["update_id"] >= offset]
+            return {"ok": True, "result": batch}
+
+        @app.post("/bot{token}/sendMessage")
+        async def send_message(token: str, request: Request):
+            await self.config.delay()
+            failure = self._failure()
+            if failure:
+                return failure
+            body = await request.json()
+            self.stats["sendMessage"] += 1
+            if self.on_text:
+                self.on_text(body["chat_id"], body.get("text", ""))
+            return {"ok": True, "result": self._message(body["chat_id"], text=body.get("text"))}
+
+        @app.post("/bot{token}/sendVoice")
+        async def send_voice(token: str, request: Request):
+            content_type = request.headers.get("content-type", "")
+            if content_type.startswith("multipart/"):
+                form = await request.form()
+                chat_id = form["chat_id"]
+                upload = form["voice"]
+                data = await upload.read()
+                file_id = "fid_" + hashlib.sha256(data).hexdigest()[:24]
+                # Uploads take longer in proportion to their size (~1 MB/s)
+                await self.config.delay(scale=1.0 + len(data) / 1_000_000)
+                self.stats["sendVoice_uploads"] += 1
+                self.stats["sendVoice_bytes"] += len(data)
+            else:
+                body = await request.json()
+                chat_id = body["chat_id"]
+                file_id = body["voice"]
+                await self.config.delay()
+
+            failure = self._failure()
+            if failure:
+                return failure
+
+            self.stats["sendVoice"] += 1
+            if self.on_voice:
+                self.on_voice(chat_id)
+            return {
+                "ok": True,
+                "result": self._message(chat_id, voice={"file_id": file_id, "duration": 10}),
+            }
+
+        @app.post("/bot{token}/sendChatAction")
+        async def send_chat_action(token: str):
+            return {"ok": True, "result": True}
+
+        @app.post("/bot{token}/getFile")
+        async def get_file(token: str, request: Request):
+            body = await request.json()
+            return {
+                "ok": True,
+                "result": {"file_id": body["file_id"], "file_path": f"voice/{body['file_id']}.oga"},
+            }
+
+        @app.get("/file/bot{token}/{file_path:path}")
+        async def download(token: str, file_path: str):
+            await self.config.delay()
+            return Response(content=random.randbytes(200_000), media_type="audio/ogg")
+
+        @app.post("/bot{token}/setWebhook")
+        async def set_webhook(token: str):
+            return {"ok": True, "result": True}
+
+        @app.post("/bot{token}/deleteWebhook")
+        async def delete_webhook(token: str):
+            return {"ok": True, "result": True}
+
+        return app
+
+
+class FakeOpenAI:
+    """Chat completions endpoint answering both crisis checks and supportive replies."""
+
+    def __init__(self, config: FakeConfig, unique_replies: bool = True):
+        self.config = config
+        self.unique_replies = unique_replies
+        self.stats = {"completions": 0, "crisis_checks": 0, "429": 0, "errors": 0}
+        self.app = self._build_app()
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/v1/chat/completions")
+        async def completions(request: Request):
+            body = await request.json()
+            outcome = self.config.roll()
+            if outcome == "429":
+                self.stats["429"] += 1
+                return JSONResponse(
+                    status_code=429,
+                    headers={"retry-after": str(self.config.retry_after)},
+                    content={"error": {"message": "Rate limit reached", "type": "requests"}},
+                )
+
+            max_tokens = body.get("max_tokens") or 200
+            await self.config.delay(scale=max(0.2, max_tokens / 200))
+
+            if outcome == "error":
+                self.stats["errors"] += 1
+                return JSONResponse(
+                    status_code=500, content={"error": {"message": "Server error", "type": "server"}}
+                )
+
+            self.stats["completions"] += 1
+            prompt = body["messages"][-1]["content"]
+            if body.get("response_format", {}).get("type") == "json_object":
+                # Batched crisis check: one verdict per message id
+                items = json.loads(prompt.rsplit("Messages:", 1)[1])
+                self.stats["crisis_checks"] += len(items)
+                content = json.dumps({"verdicts": {item["id"]: "OK" for item in items}})
+            elif max_tokens <= 10 or "crisis detection system" in prompt:
+                self.stats["crisis_checks"] += 1
+                content = "OK"
+            else:
+                suffix = f" (#{random.randint(0, 10**9)})" if self.unique_replies else ""
+                content = (
+                    "Hey friend, I hear you. Cravings come in waves and this one will pass too. "
+                    "Take a slow breath, drink some water, and remind yourself how far you've come. "
+                    "I'm proud of you for reaching out." + suffix
+                )
+
+            if body.get("stream"):
+                return Response(
+                    content=self._stream(body.get("model", "gpt-4o-mini"), content),
+                    media_type="text/event-stream",
+                )
+
+            return {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "gpt-4o-mini"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": len(prompt) // 4,
+                    "completion_tokens": len(content) // 4,
+                    "total_tokens": (len(prompt) + len(content)) // 4,
+                },
+            }
+
+        return app
+
+    @staticmethod
+    def _stream(model: str, content: str) -> str:
+        events = []
+        for word in content.split(" "):
+            chunk = {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+            }
+            events.append(f"data: {json.dumps(chunk)}\n\n")
+        events.append("data: [DONE]\n\n")
+        return "".join(events)
+
+
+class FakeElevenLabs:
+    """Text-to-speech, voice cloning and conversational signed URL endpoints."""
+
+    def __init__(self, config: FakeConfig, bytes_per_char: int = 300):
+        self.config = config
+        self.bytes_per_char = bytes_per_char
+        self.stats = {"tts": 0, "tts_chars": 0, "voices_added": 0, "signed_urls": 0, "429": 0, "errors": 0}
+        self.app = self._build_app()
+
+    def _failure(self) -> JSONResponse | None:
+        outcome = self.config.roll()
+        if outcome == "429":
+            self.stats["429"] += 1
+            return JSONResponse(
+                status_code=429, content={"detail": {"status": "too_many_concurrent_requests"}}
+            )
+        if outcome == "error":
+            self.stats["errors"] += 1
+            return JSONResponse(status_code=500, content={"detail": "Internal error"})
+        return None
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/v1/text-to-speech/{voice_id}")
+        async def tts(voice_id: str, request: Request, output_format: str = "mp3_44100_128"):
+            body = await request.json()
+            text = body.get("text", "")
+            # Synthesis time grows with text length
+            await self.config.delay(scale=max(0.2, len(text) / 400))
+            failure = self._failure()
+            if failure:
+                return failure
+            self.stats["tts"] += 1
+            self.stats["tts_chars"] += len(text)
+            seed = hashlib.sha256(f"{voice_id}:{text}".encode()).digest()
+            if output_format.startswith("opus"):
+                return Response(content=self._fake_opus(seed, len(text)), media_type="audio/ogg")
+            audio = (seed * (self.bytes_per_char * max(1, len(text)) // len(seed) + 1))
+            return Response(content=audio[: self.bytes_per_char * max(1, len(text))], media_type="audio/mpeg")
+
+        @app.post("/v1/voices/add")
+        async def add_voice():
+            await self.config.delay(scale=3.0)
+            failure = self._failure()
+            if failure:
+                return failure
+            self.stats["voices_added"] += 1
+            return {"voice_id": f"bench_voice_{self.stats['voices_added']}"}
+
+        @app.delete("/v1/voices/{voice_id}")
+        async def delete_voice(voice_id: str):
+            return {"status": "ok"}
+
+        @app.get("/v1/convai/conversation/get_signed_url")
+        async def signed_url(agent_id: str):
+            await self.config.delay()
+            self.stats["signed_urls"] += 1
+            return {"signed_url": f"wss://bench.invalid/convai?agent_id={agent_id}&n={self.stats['signed_urls']}"}
+
+        return app
+
+    @staticmethod
+    def _fake_opus(seed: bytes, chars: int) -> bytes:
+        """A structurally valid Ogg/Opus file (~15 chars of text per second, 32 kbps)."""
+        serial = int.from_bytes(seed[:4], "little")
+        head = b"OpusHead" + bytes([1, 1]) + struct.pack("<HIhB", 312, 48000, 0, 0)
+        tags = b"OpusTags" + struct.pack("<I", 0) + struct.pack("<I", 0)
+        pages = [
+            OggPage(0x02, 0, serial, 0, bytes([len(head)]), head),
+            OggPage(0x00, 0, serial, 1, bytes([len(tags)]), tags),
+        ]
+        seconds = max(1, chars // 15)
+        granule = 312
+        for i in range(seconds):
+            # One second of 20 ms packets at 80 bytes each
+            granule += 48000
+            body = (seed * 3)[:80] * 50
+            header_type = 0x04 if i == seconds - 1 else 0x00
+            pages.append(OggPage(header_type, granule, serial, 2 + i, bytes([80] * 50), body))
+        return b"".join(page.to_bytes() for page in pages)
@@ -0,0 +1,275 @@
+"""
+End-to-end load test for the Telegram pipeline against local fakes.
+
+Starts fake Telegram, OpenAI and ElevenLabs servers, points the app at them,
+drives either the polling loop or /api/telegram/webhook at a target rate and
+reports time-to-voice-note percentiles, throughput and peak memory.
+
+Usage (from backend/, after `pip install -r benchmarks/requirements.txt`):
+    python -m benchmarks.load_test --mode polling --rate 10 --duration 30
+    python -m benchmarks.load_test --mode webhook --rate 20 --openai-latency 0.8 --output run.json
+    python -m benchmarks.load_test --coalesce-ms 0   # one voice note per message, no quiet window
+
+Everything runs in one process, so peak RSS includes the fakes. Exits
+non-zero if no voice note came back at all, since that means the setup is
+broken rather than slow.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import tempfile
+from collections import defaultdict, deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+
+from benchmarks.env import configure_env  # noqa: E402
+from benchmarks.fakes import FakeConfig, FakeTelegram, FakeOpenAI, FakeElevenLabs  # noqa: E402
+
+SAMPLE_MESSAGES = [
+    "I'm really struggling with cravings tonight",
+    "Work was awful and I want a drink",
+    "I made it through the weekend without using",
+    "I feel anxious about seeing my old friends",
+    "Can you help me calm down a bit?",
+    "I keep thinking about gambling again",
+    "Today was day 12, it's getting a little easier",
+    "I'm lonely and it makes the urges worse",
+]
+
+FALLBACK_MARKER = "Technical difficulties"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["polling", "webhook"], default="polling")
+    parser.add_argument("--rate", type=float, default=5.0, help="incoming messages per second")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load")
+    parser.add_argument("--chats", type=int, default=50, help="distinct chats sending messages")
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--openai-latency", type=float, default=0.6)
+    parser.add_argument("--elevenlabs-latency", type=float, default=1.5)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="5xx rate for every fake")
+    parser.add_argument("--telegram-429-rate", type=float, default=0.0)
+    parser.add_argument("--openai-429-rate", type=float, default=0.0)
+    parser.add_argument("--elevenlabs-429-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--cacheable", action="store_true", help="fake OpenAI returns identical replies")
+    parser.add_argument(
+        "--coalesce-ms", type=float, default=None,
+        help="per-chat quiet window (default: the app's COALESCE_QUIET_MS, so its cost shows up in "
+        "the latencies); 0 answers every message with its own voice note",
+    )
+    parser.add_argument("--base-port", type=int, default=18700)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here as well")
+    return parser.parse_args(argv)
+
+
+async def serve(app, port: int, lifespan: str = "off") -> tuple[uvicorn.Server, asyncio.Task]:
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan=lifespan)
+    server = uvicorn.Server(config)
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    return server, task
+
+
+def percentile(sorted_values: list[float], pct: float) -> float | None:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return round(sorted_values[index], 4)
+
+
+class Tracker:
+    """
+    Matches voice notes to the messages that triggered them (FIFO per chat).
+    With coalescing on, one voice note answers every message pending in its
+    chat, and each of them gets a latency sample.
+    """
+
+    def __init__(self, coalescing: bool = False):
+        self.coalescing = coalescing
+        self.pending: dict[str, deque] = defaultdict(deque)
+        self.latencies: list[float] = []
+        self.voice_notes = 0
+        self.fallbacks = 0
+        self.rejected = 0
+        self.first_sent = None
+        self.last_delivered = None
+
+    def sent(self, chat_id):
+        now = time.perf_counter()
+        self.first_sent = self.first_sent or now
+        self.pending[str(chat_id)].append(now)
+
+    def on_voice(self, chat_id):
+        queue = self.pending.get(str(chat_id))
+        if queue:
+            now = time.perf_counter()
+            self.voice_notes += 1
+            self.latencies.append(now - queue.popleft())
+            while self.coalescing and queue:
+                self.latencies.append(now - queue.popleft())
+            self.last_delivered = now
+
+    def on_text(self, chat_id, text: str):
+        if FALLBACK_MARKER in text:
+            self.fallbacks += 1
+            queue = self.pending.get(str(chat_id))
+            if queue:
+                queue.popleft()
+
+    def outstanding(self) -> int:
+        return sum(len(q) for q in self.pending.values())
+
+
+async def drive(args, tracker: Tracker, telegram: FakeTelegram, app_port: int):
+    total = int(args.rate * args.duration)
+    chats = [100000 + i for i in range(args.chats)]
+    start = time.perf_counter()
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{app_port}", timeout=30.0) as client:
+        webhook_calls = []
+        for i in range(total):
+            delay = start + i / args.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            chat_id = random.choice(chats)
+            text = random.choice(SAMPLE_MESSAGES)
+            tracker.sent(chat_id)
+
+            if args.mode == "polling":
+                telegram.push_message(chat_id, text)
+            else:
+                update = telegram.make_update(chat_id, text)
+                webhook_calls.append(asyncio.create_task(_post_webhook(client, update, tracker)))
+
+        if webhook_calls:
+            await asyncio.gather(*webhook_calls)
+
+    return total
+
+
+async def _post_webhook(client: httpx.AsyncClient, update: dict, tracker: Tracker):
+    chat_id = update["message"]["chat"]["id"]
+    try:
+        response = await client.post("/api/telegram/webhook", json=update)
+        if response.status_code != 200:
+            tracker.rejected += 1
+            tracker.pending[str(chat_id)].pop()
+    except httpx.HTTPError:
+        tracker.rejected += 1
+        tracker.pending[str(chat_id)].pop()
+
+
+async def run(args) -> dict:
+    random.seed(args.seed)
+    ports = {
+        "telegram": args.base_port,
+        "openai": args.base_port + 1,
+        "elevenlabs": args.base_port + 2,
+        "app": args.base_port + 3,
+    }
+    state_dir = tempfile.mkdtemp(prefix="kalm_bench_")
+    overrides = {} if args.coalesce_ms is None else {"COALESCE_QUIET_MS": str(args.coalesce_ms)}
+    configure_env(ports, state_dir, **overrides)
+
+    # Read back from the app, so the report shows the window that actually applied
+    from services.coalescer import COALESCE_QUIET_MS
+
+    tracker = Tracker(coalescing=COALESCE_QUIET_MS > 0)
+    telegram = FakeTelegram(
+        FakeConfig(args.telegram_latency, args.jitter, args.error_rate, args.telegram_429_rate, args.retry_after),
+        on_voice=tracker.on_voice,
+        on_text=tracker.on_text,
+    )
+    openai = FakeOpenAI(
+        FakeConfig(args.openai_latency, args.jitter, args.error_rate, args.openai_429_rate, args.retry_after),
+        unique_replies=not args.cacheable,
+    )
+    elevenlabs = FakeElevenLabs(
+        FakeConfig(args.elevenlabs_latency, args.jitter, args.error_rate, args.elevenlabs_429_rate, args.retry_after),
+    )
+
+    servers = [
+        await serve(telegram.app, ports["telegram"]),
+        await serve(openai.app, ports["openai"]),
+        await serve(elevenlabs.app, ports["elevenlabs"]),
+    ]
+
+    # Import only now, so the services pick up the fake endpoints
+    import main
+
+    servers.append(await serve(main.app, ports["app"], lifespan="on"))
+
+    sent = await drive(args, tracker, telegram, ports["app"])
+    load_done = time.perf_counter()
+
+    deadline = load_done + args.drain_timeout
+    while tracker.outstanding() and time.perf_counter() < deadline:
+        await asyncio.sleep(0.1)
+
+    for server, _ in reversed(servers):
+        server.should_exit = True
+    await asyncio.gather(*(task for _, task in servers), return_exceptions=True)
+
+    latencies = sorted(tracker.latencies)
+    elapsed = (tracker.last_delivered or load_done) - (tracker.first_sent or load_done)
+
+    return {
+        "mode": args.mode,
+        "target_rate": args.rate,
+        "duration": args.duration,
+        "chats": args.chats,
+        "coalesce_ms": COALESCE_QUIET_MS,
+        "messages_sent": sent,
+        "voice_notes": tracker.voice_notes,
+        "answered_messages": len(latencies),
+        "fallback_texts": tracker.fallbacks,
+        "rejected": tracker.rejected,
+        "undelivered": tracker.outstanding(),
+        "throughput_per_second": round(len(latencies) / elapsed, 3) if elapsed > 0 else None,
+        "time_to_voice_note_seconds": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": round(latencies[-1], 4) if latencies else None,
+        },
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "upstream_calls": {
+            "telegram": telegram.stats,
+            "openai": openai.stats,
+            "elevenlabs": elevenlabs.stats,
+        },
+    }
+
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    if report["messages_sent"] and not report["voice_notes"]:
+        print("No voice notes were delivered - check the fakes and app logs above", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
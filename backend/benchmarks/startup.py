@@ -0,0 +1,169 @@
+"""
+Cold-start benchmark: how long a fresh process takes to import the app,
+finish startup and answer its first requests.
+
+Each run is a separate interpreter, so import caches don't carry over. The
+child imports the app before anything else, then starts the local fakes
+(see fakes.py) and measures:
+
+- import_seconds: `import main` (FastAPI, services, any SDKs loaded eagerly)
+- startup_seconds: uvicorn startup including the lifespan hook
+- first_health_seconds: first GET /health
+- first_reply_seconds: first webhook message until its voice note reaches
+  the fake Telegram (includes lazily created SDK clients)
+
+It also reports which heavy SDKs were already imported after `import main`.
+
+Usage (from backend/):
+    python -m benchmarks.startup --runs 5 --mode webhook
+    python -m benchmarks.startup --runs 3 --mode polling --output startup.json
+"""
+import time
+
+_PROCESS_START = time.perf_counter()
+
+import os  # noqa: E402
+import sys  # noqa: E402
+import json  # noqa: E402
+import argparse  # noqa: E402
+import statistics  # noqa: E402
+import subprocess  # noqa: E402
+import tempfile  # noqa: E402
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, BACKEND_DIR)
+
+HEAVY_MODULES = ["openai", "elevenlabs", "pydantic", "fastapi", "httpx"]
+
+METRICS = ["import_seconds", "startup_seconds", "first_health_seconds", "first_reply_seconds", "total_seconds"]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--mode", choices=["polling", "webhook"], default="webhook")
+    parser.add_argument("--base-port", type=int, default=18800)
+    parser.add_argument("--reply-timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="write the JSON report here as well")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+async def _measure(args) -> dict:
+    import asyncio
+
+    from benchmarks.env import configure_env
+
+    ports = {
+        "telegram": args.base_port,
+        "openai": args.base_port + 1,
+        "elevenlabs": args.base_port + 2,
+        "app": args.base_port + 3,
+    }
+    state_dir = tempfile.mkdtemp(prefix="kalm_startup_")
+    configure_env(ports, state_dir, TELEGRAM_MODE=args.mode, COALESCE_QUIET_MS="0")
+
+    # The app is imported first, so its import time includes everything it pulls in
+    import_start = time.perf_counter()
+    import main
+
+    import_seconds = time.perf_counter() - import_start
+    loaded = {name: name in sys.modules for name in HEAVY_MODULES}
+
+    import httpx
+    from benchmarks.fakes import FakeConfig, FakeTelegram, FakeOpenAI, FakeElevenLabs
+    from benchmarks.load_test import serve
+
+    replied = asyncio.Event()
+    telegram = FakeTelegram(FakeConfig(), on_voice=lambda chat_id: replied.set())
+    servers = [
+        await serve(telegram.app, ports["telegram"]),
+        await serve(FakeOpenAI(FakeConfig()).app, ports["openai"]),
+        await serve(FakeElevenLabs(FakeConfig()).app, ports["elevenlabs"]),
+    ]
+
+    startup_start = time.perf_counter()
+    servers.append(await serve(main.app, ports["app"], lifespan="on"))
+    startup_seconds = time.perf_counter() - startup_start
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{ports['app']}", timeout=args.reply_timeout) as client:
+        health_start = time.perf_counter()
+        await client.get("/health")
+        first_health_seconds = time.perf_counter() - health_start
+
+        reply_start = time.perf_counter()
+        await client.post("/api/telegram/webhook", json=telegram.make_update(424242, "Rough day, could use some support"))
+        try:
+            await asyncio.wait_for(replied.wait(), timeout=args.reply_timeout)
+            first_reply_seconds = time.perf_counter() - reply_start
+        except asyncio.TimeoutError:
+            first_reply_seconds = None
+
+    for server, _ in reversed(servers):
+        server.should_exit = True
+    await asyncio.gather(*(task for _, task in servers), return_exceptions=True)
+
+    return {
+        "import_seconds": round(import_seconds, 4),
+        "startup_seconds": round(startup_seconds, 4),
+        "first_health_seconds": round(first_health_seconds, 4),
+        "first_reply_seconds": round(first_reply_seconds, 4) if first_reply_seconds is not None else None,
+        "total_seconds": round(time.perf_counter() - _PROCESS_START, 4),
+        "loaded_after_import": loaded,
+    }
+
+
+def run_child(args):
+    import asyncio
+
+    print(json.dumps(asyncio.run(_measure(args))))
+
+
+def summarize(runs: list[dict]) -> dict:
+    summary = {}
+    for metric in METRICS:
+        values = [run[metric] for run in runs if run.get(metric) is not None]
+        if values:
+            summary[metric] = {
+                "median": round(statistics.median(values), 4),
+                "min": round(min(values), 4),
+                "max": round(max(values), 4),
+            }
+    return summary
+
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        run_child(args)
+        return
+
+    runs = []
+    for index in range(args.runs):
+        result = subprocess.run(
+            [
+                sys.executable, "-m", "benchmarks.startup", "--child",
+                "--mode", args.mode,
+                "--base-port", str(args.base_port + 10 * index),
+                "--reply-timeout", str(args.reply_timeout),
+            ],
+            cwd=BACKEND_DIR,
+            capture_output=True,
+            text=True,
+        )
+        lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+        if result.returncode != 0 or not lines:
+            print(result.stdout + result.stderr, file=sys.stderr)
+            raise SystemExit(f"Run {index + 1} failed")
+        runs.append(json.loads(lines[-1]))
+
+    report = {"mode": args.mode, "runs": len(runs), "summary": summarize(runs), "samples": runs}
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main_cli()
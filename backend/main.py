@@ -1,26 +1,60 @@
 import os
+import time
 import asyncio
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 load_dotenv()
 
-import httpx
-from fastapi import FastAPI, HTTPException, Request, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
-from services.elevenlabs import generate_voice_message, create_voice_clone
-from services.voice_store import save_user_voice, get_user_voice
+from services.elevenlabs import (
+    generate_voice_message,
+    generate_voice_message_streamed,
+    create_voice_clone,
+)
+from services.voice_store import get_user_voice, get_user_voice_for_sample, touch_user_voice, was_voice_evicted
+from services.voice_prep import VoiceSampleError, check_declared_duration, prepare_voice_sample, get_voice_prep_stats
+from services.media_registry import content_hash
+from services.voice_slots import voice_slots, is_slot_limit_error
+from services.tts_cache import tts_cache
+from services.scheduler import scheduler
+from services.coalescer import MessageCoalescer
+from services.update_dedup import update_dedup
+from services.state import get_state, LeaderLock
+from services.welcome_cache import welcome_cache, normalize_recovery_type
+from services.fallback_audio import fallback_library
+from services.conversation_urls import signed_url_pool, SignedUrlError
+from services.broadcast import broadcaster
+from services.checkins import (
+    checkin_engine,
+    parse_send_time,
+    parse_timezone,
+    CHECKIN_DEFAULT_TIME,
+    CHECKIN_DEFAULT_TIMEZONE,
+)
+from services.resilience import get_circuit_stats
+from services import metrics
 
-# ElevenLabs Conversational AI Agent ID
-ELEVENLABS_AGENT_ID = os.getenv("ELEVENLABS_AGENT_ID")
 WEBSITE_URL = os.getenv("WEBSITE_URL", "http://localhost:3000")
+
+# "polling" runs the elected long-poller; "webhook" (serverless/autoscaled) skips polling
+# setup and startup warm-ups entirely so a cold start only has to import the app
+TELEGRAM_MODE = os.getenv("TELEGRAM_MODE", "polling").lower()
+
+# Overlap reply generation with synthesis by streaming sentences into TTS
+STREAMING_TTS = os.getenv("STREAMING_TTS", "true").lower() == "true"
 from services.openai_service import (
     generate_supportive_response,
     detect_crisis,
     generate_crisis_voice_response,
+    stream_supportive_response,
+    crisis_batcher,
 )
+from services.crisis_classifier import prescreen as prescreen_crisis, CRISIS
 from services.telegram_service import (
     send_voice_message,
     send_text_message,
@@ -30,10 +64,20 @@ from services.telegram_service import (
     get_updates,
     get_file,
     download_file,
+    open_client as open_telegram_client,
+    close_client as close_telegram_client,
+    get_pool_stats as get_telegram_pool_stats,
+    get_rate_limit_stats as get_telegram_rate_limit_stats,
 )
 
-# Track users waiting to send voice for cloning
-users_awaiting_voice = set()
+# How long a /clone waits for the voice sample (kept in the shared state store)
+CLONE_AWAIT_TTL_SECONDS = float(os.getenv("CLONE_AWAIT_TTL_SECONDS", "900"))
+
+# Only one process polls Telegram; the others wait to take over the lock
+POLLER_LOCK_TTL_SECONDS = float(os.getenv("POLLER_LOCK_TTL_SECONDS", "30"))
+
+# Set by /api/telegram/set-webhook so no process starts polling (which would remove the webhook)
+WEBHOOK_MODE_KEY = "telegram:webhook_mode"
 
 WELCOME_MESSAGE = """Hey {name}, welcome to Kalm. I'm so glad you're here. I'm your personal recovery companion, available 24/7 whenever you need support. Whether you're feeling stressed, having cravings, or just need someone to talk to - I'm here for you. Just send me a message anytime, and I'll respond with a voice note. You've already taken a brave step by being here. You're not alone in this journey."""
 
@@ -55,9 +99,36 @@ You can also text:
 These services are free, confidential, and available 24/7. You matter, and help is available right now. 💚"""
 
 
-async def process_voice_clone(chat_id: int, voice_file_id: str, first_name: str):
+# Best-effort background tasks (kept referenced until they finish)
+_background_tasks = set()
+
+
+def _spawn(coro) -> asyncio.Task:
+    """Run a best-effort coroutine in the background, logging any failure."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+
+    def _done(t: asyncio.Task):
+        _background_tasks.discard(t)
+        if not t.cancelled() and t.exception():
+            print(f"Background task error: {t.exception()}")
+
+    task.add_done_callback(_done)
+    return task
+
+
+async def is_awaiting_voice(chat_id: int) -> bool:
+    """Whether this chat sent /clone and we're waiting for its voice sample."""
+    return await get_state().get(f"clone_await:{chat_id}") is not None
+
+
+async def process_voice_clone(chat_id: int, voice_file_id: str, first_name: str, duration: float | None = None):
     """Process a voice message for cloning."""
+    done = True
     try:
+        # Reject clips that are obviously too short before downloading anything
+        check_declared_duration(duration)
+
         await send_text_message(chat_id, "🎤 Got your voice! Cloning now... This may take a moment.")
 
         # Get file info and download
@@ -68,20 +139,48 @@ async def process_voice_clone(chat_id: int, voice_file_id: str, first_name: str)
         file_path = file_info["result"]["file_path"]
         audio_bytes = await download_file(file_path)
 
+        # The same sample sent again reuses the voice already cloned from it
+        sample_hash = content_hash(audio_bytes)
+        if get_user_voice_for_sample(str(chat_id), sample_hash):
+            await send_text_message(
+                chat_id,
+                f"✨ That's the same recording as your current voice, {first_name}, so it's already set up!\n\nUse /personal anytime to hear an encouraging message in that voice. 💚"
+            )
+            return
+
+        # Check length, trim silence and cap at CLONE_MAX_SECONDS
+        audio_bytes = await prepare_voice_sample(audio_bytes)
+
+        # Free a slot first if the account is nearly full
+        await voice_slots.ensure_slot(str(chat_id))
+
         # Create voice clone with ElevenLabs
-        voice_id = await create_voice_clone(
-            audio_bytes=audio_bytes,
-            name=f"kalm_user_{chat_id}"
-        )
+        try:
+            voice_id = await create_voice_clone(
+                audio_bytes=audio_bytes,
+                name=f"kalm_user_{chat_id}"
+            )
+        except Exception as e:
+            # Voices created outside the bot can still fill the account; evict one and retry once
+            if not is_slot_limit_error(e) or not await voice_slots.evict(1, keep=str(chat_id)):
+                raise
+            voice_id = await create_voice_clone(
+                audio_bytes=audio_bytes,
+                name=f"kalm_user_{chat_id}"
+            )
 
-        # Save the voice ID
-        save_user_voice(str(chat_id), voice_id)
+        # Save the voice ID (deleting the voice it replaces)
+        await voice_slots.save(str(chat_id), voice_id, sample_hash)
 
         await send_text_message(
             chat_id,
             f"✨ Voice cloned successfully, {first_name}!\n\nNow you can use /personal anytime to hear an encouraging message in that voice. Try it now! 💚"
         )
 
+    except VoiceSampleError as e:
+        # Keep waiting, so the next voice message is taken as a new sample
+        done = False
+        await send_text_message(chat_id, str(e))
     except Exception as e:
         print(f"Voice cloning error: {e}")
         await send_text_message(
@@ -89,16 +188,66 @@ async def process_voice_clone(chat_id: int, voice_file_id: str, first_name: str)
             "Sorry, I couldn't clone your voice. Please try again with a clearer recording (15-30 seconds works best). 🎙️"
         )
     finally:
-        # Remove from awaiting set
-        users_awaiting_voice.discard(chat_id)
+        # No longer waiting for a sample
+        if done:
+            await get_state().delete(f"clone_await:{chat_id}")
+
+
+async def _tee(chunks, sink: list):
+    """Pass streamed text chunks through while keeping a copy for logging."""
+    async for chunk in chunks:
+        sink.append(chunk)
+        yield chunk
+
+
+def _record_voice_note(flow: str, received_at: float | None):
+    """Observe end-to-end time from receiving a message to its voice note going out."""
+    if received_at is not None:
+        metrics.TIME_TO_VOICE_NOTE.observe(flow, value=time.perf_counter() - received_at)
+
+
+async def send_helplines(chat_id: int):
+    """Send the emergency helplines as a text message."""
+    await send_text_message(chat_id, CRISIS_HELPLINES)
+
+
+async def send_crisis_support(
+    chat_id: int, first_name: str, received_at: float | None = None, helplines_sent: bool = False
+):
+    """Send the helplines immediately (unless already sent), then a compassionate voice message."""
+    # Send emergency helplines TEXT MESSAGE immediately
+    if not helplines_sent:
+        await send_helplines(chat_id)
+
+    # Then send a compassionate voice message
+    await send_text_message(chat_id, "Recording a message for you... 🎙️")
+    crisis_response = await generate_crisis_voice_response(first_name)
+    audio_bytes = await fallback_library.with_fallback("crisis", generate_voice_message(crisis_response))
+    await send_voice_message(chat_id=str(chat_id), audio_bytes=audio_bytes)
+    _record_voice_note("crisis", received_at)
+
+
+async def process_telegram_message(
+    chat_id: int,
+    text: str,
+    first_name: str = "friend",
+    received_at: float | None = None,
+    crisis_check=None,
+    helplines_sent: bool = False,
+):
+    """
+    Process incoming message and send voice response. `crisis_check` is an
+    already-prepared crisis check coroutine (from the coalescer), used
+    instead of a fresh detect_crisis call; `helplines_sent` is set when the
+    coalescer already sent the helplines for a flagged fragment.
+    """
+    if received_at is None:
+        received_at = time.perf_counter()
 
-
-async def process_telegram_message(chat_id: int, text: str, first_name: str = "friend"):
-    """Process incoming message and send voice response."""
     try:
         # Handle /clone command - start voice cloning flow
         if text.startswith("/clone"):
-            users_awaiting_voice.add(chat_id)
+            await get_state().set(f"clone_await:{chat_id}", "1", ex=CLONE_AWAIT_TTL_SECONDS)
             await send_text_message(
                 chat_id,
                 f"🎤 Let's set up a personal voice, {first_name}!\n\nYou can clone your own voice to hear encouragement from your future self, OR clone the voice of a friend or family member who supports your recovery.\n\nPlease send me a voice message (15-30 seconds) of whoever you'd like to clone - speaking clearly and naturally. Say anything - maybe an introduction or reading a passage.\n\nOnce cloned, use /personal to hear a supportive message in that voice! 💚"
@@ -108,6 +257,14 @@ async def process_telegram_message(chat_id: int, text: str, first_name: str = "f
         # Handle /personal command - send message in cloned voice
         if text.startswith("/personal"):
             voice_id = get_user_voice(str(chat_id))
+            if not voice_id and was_voice_evicted(str(chat_id)):
+                # Evicted to free a slot: go straight into the clone flow
+                await get_state().set(f"clone_await:{chat_id}", "1", ex=CLONE_AWAIT_TTL_SECONDS)
+                await send_text_message(
+                    chat_id,
+                    f"Your personal voice hasn't been used in a while, {first_name}, so I cleared it to make room for others. 🎙️\n\nJust send me a new voice message (15-30 seconds) and I'll set it up again - then /personal will work like before. 💚"
+                )
+                return
             if not voice_id:
                 await send_text_message(
                     chat_id,
@@ -115,6 +272,7 @@ async def process_telegram_message(chat_id: int, text: str, first_name: str = "f
                 )
                 return
 
+            touch_user_voice(str(chat_id))
             await send_text_message(chat_id, "Recording a personal message for you... 🎙️")
 
             # Check if user provided a custom prompt after /personal
@@ -127,13 +285,47 @@ async def process_telegram_message(chat_id: int, text: str, first_name: str = "f
 The user has requested: {custom_prompt}
 
 Respond with warmth and encouragement, fulfilling their request. Start with "Hey {first_name}," and keep it under 150 words. Make it personal and heartfelt."""
-                personal_message = await generate_supportive_response(prompt, first_name)
+                if STREAMING_TTS:
+                    audio_bytes = await generate_voice_message_streamed(
+                        stream_supportive_response(prompt, first_name), voice_id=voice_id
+                    )
+                else:
+                    personal_message = await generate_supportive_response(prompt, first_name)
+                    audio_bytes = await generate_voice_message(personal_message, voice_id=voice_id)
             else:
                 # Default encouragement
                 personal_message = f"""Hey {first_name}, I just want you to know how proud I am of you. I know things might feel hard right now, but you're doing something incredible. Every day you choose recovery, you're choosing yourself. You're building a life worth living. Keep going - you've got this, and I believe in you."""
+                audio_bytes = await generate_voice_message(personal_message, voice_id=voice_id)
 
-            audio_bytes = generate_voice_message(personal_message, voice_id=voice_id)
             await send_voice_message(chat_id=str(chat_id), audio_bytes=audio_bytes)
+            _record_voice_note("personal", received_at)
+            return
+
+        # Handle /stopcheckin command - opt out of daily check-ins
+        if text.startswith("/stopcheckin"):
+            if await checkin_engine.opt_out(chat_id):
+                await send_text_message(chat_id, "Okay, no more daily check-ins. I'm still here whenever you message me. 💚")
+            else:
+                await send_text_message(chat_id, "You're not signed up for daily check-ins. Use /checkin to start them.")
+            return
+
+        # Handle /checkin command - opt in to a daily voice check-in: "/checkin 08:30 Europe/London"
+        if text.startswith("/checkin"):
+            args = text.split()[1:]
+            send_time = args[0] if args else CHECKIN_DEFAULT_TIME
+            tz_name = args[1] if len(args) > 1 else CHECKIN_DEFAULT_TIMEZONE
+            if not parse_send_time(send_time) or not parse_timezone(tz_name):
+                await send_text_message(
+                    chat_id,
+                    "I couldn't read that time. Try /checkin 08:30 Europe/London (or a UTC offset like /checkin 8:30 +2)."
+                )
+                return
+
+            await checkin_engine.opt_in(chat_id, first_name, send_time, tz_name)
+            await send_text_message(
+                chat_id,
+                f"🌅 You're signed up, {first_name}! I'll send you a voice check-in every day at {send_time} ({tz_name}).\n\nUse /stopcheckin anytime to stop them."
+            )
             return
 
         # Handle /call command - send link to voice chat (no voice message)
@@ -153,59 +345,99 @@ Respond with warmth and encouragement, fulfilling their request. Start with "Hey
                 "/start — Start the bot and see this welcome message\n"
                 "/clone — Clone a voice (yours or a loved one's) for personalised encouragement\n"
                 "/personal — Hear a supportive message in your cloned voice\n"
-                "/call — Start a real-time voice conversation with Kalm"
+                "/call — Start a real-time voice conversation with Kalm\n"
+                "/checkin — Get a daily voice check-in (e.g. /checkin 08:30 Europe/London)\n"
+                "/stopcheckin — Stop daily check-ins"
             )
             await send_text_message(chat_id, "Recording voice message... 🎙️")
 
             # Parse deep link parameter: "/start alcohol" → "alcohol"
             parts = text.split(maxsplit=1)
-            recovery_type = parts[1] if len(parts) > 1 else None
+            recovery_type = normalize_recovery_type(parts[1]) if len(parts) > 1 else None
 
             if recovery_type:
-                # Personalized welcome based on recovery type from website
-                prompt = f"The user {first_name} is starting their recovery journey from {recovery_type}. Give them a warm, personalized welcome that acknowledges their specific struggle with {recovery_type} and offers encouragement. Keep it under 100 words."
-                welcome_text = await generate_supportive_response(prompt, first_name)
+                # Personalized welcome based on recovery type from website, served
+                # from a pre-generated pool with the user's name spoken up front
+                audio_bytes = await fallback_library.with_fallback(
+                    "welcome", welcome_cache.get_welcome(recovery_type, first_name)
+                )
             else:
                 # Generic welcome
                 welcome_text = WELCOME_MESSAGE.format(name=first_name)
+                audio_bytes = await fallback_library.with_fallback(
+                    "welcome", generate_voice_message(welcome_text)
+                )
 
-            audio_bytes = generate_voice_message(welcome_text)
             await send_voice_message(chat_id=str(chat_id), audio_bytes=audio_bytes)
+            _record_voice_note("welcome", received_at)
             return
 
-        # 1. Check for crisis/emergency situations FIRST
-        print(f"🔍 Checking for crisis indicators...")
-        is_crisis = await detect_crisis(text)
-
-        if is_crisis:
-            print(f"🚨 CRISIS DETECTED for {first_name}")
+        # 1. Clearly high-risk language gets the helplines before any network
+        # call; the LLM check below still decides between crisis flow and reply
+        if not helplines_sent and prescreen_crisis(text) == CRISIS:
+            print(f"🚨 Crisis language (pre-screen) for {first_name}, sending helplines")
+            await send_helplines(chat_id)
+            helplines_sent = True
 
-            # Send emergency helplines TEXT MESSAGE immediately
-            await send_text_message(chat_id, CRISIS_HELPLINES)
+        # 2. Start the crisis check, the supportive reply and the "recording"
+        # status together. The reply is discarded if the message is a crisis.
+        print(f"🔍 Checking for crisis indicators...")
+        crisis_task = asyncio.create_task(crisis_check if crisis_check is not None else detect_crisis(text))
+        print(f"🤖 Generating response for: {text[:50]}...")
+        if STREAMING_TTS:
+            # Sentences are synthesized as they stream in, once the crisis check clears
+            crisis_cleared = asyncio.Event()
+            reply_chunks = []
+            response_task = asyncio.create_task(
+                fallback_library.with_fallback(
+                    "reply",
+                    generate_voice_message_streamed(
+                        _tee(stream_supportive_response(text, first_name), reply_chunks),
+                        gate=crisis_cleared,
+                    ),
+                )
+            )
+        else:
+            response_task = asyncio.create_task(generate_supportive_response(text, first_name))
+        _spawn(send_chat_action(chat_id, "record_voice"))
 
-            # Then send a compassionate voice message
-            await send_text_message(chat_id, "Recording a message for you... 🎙️")
-            crisis_response = await generate_crisis_voice_response(first_name)
-            audio_bytes = generate_voice_message(crisis_response)
-            await send_voice_message(chat_id=str(chat_id), audio_bytes=audio_bytes)
-            return
+        try:
+            is_crisis = await crisis_task
 
-        # 2. Normal flow - send "Recording voice message..."
-        await send_text_message(chat_id, "Recording voice message... 🎙️")
+            if is_crisis:
+                print(f"🚨 CRISIS DETECTED for {first_name}")
+                response_task.cancel()
+                await send_crisis_support(chat_id, first_name, received_at, helplines_sent)
+                return
 
-        # 3. Generate AI response using OpenAI
-        print(f"🤖 Generating response for: {text[:50]}...")
-        response_text = await generate_supportive_response(text, first_name)
-        print(f"✅ Response generated: {response_text[:50]}...")
+            if STREAMING_TTS:
+                crisis_cleared.set()
 
-        # 4. Convert to voice using ElevenLabs
-        audio_bytes = generate_voice_message(response_text)
+            # 3. Normal flow - send "Recording voice message..."
+            await send_text_message(chat_id, "Recording voice message... 🎙️")
 
-        # 5. Send voice message
+            if STREAMING_TTS:
+                # 4-5. Collect the voice note that has been streaming in the background
+                audio_bytes = await response_task
+                print(f"✅ Response generated: {' '.join(reply_chunks)[:50]}...")
+            else:
+                # 4. Collect the AI response that has been generating in the background
+                response_text = await response_task
+                print(f"✅ Response generated: {response_text[:50]}...")
+        finally:
+            if not response_task.done():
+                response_task.cancel()
+
+        if not STREAMING_TTS:
+            # 5. Convert to voice using ElevenLabs
+            audio_bytes = await fallback_library.with_fallback("reply", generate_voice_message(response_text))
+
+        # 6. Send voice message
         await send_voice_message(
             chat_id=str(chat_id),
             audio_bytes=audio_bytes,
         )
+        _record_voice_note("reply", received_at)
 
     except Exception as e:
         # If voice fails, send text as fallback
@@ -216,14 +448,47 @@ Respond with warmth and encouragement, fulfilling their request. Start with "Hey
         )
 
 
-# Polling task
+async def _escalate_burst(chat_id: int, first_name: str, received_at: float, helplines_sent: bool):
+    # Bypasses the chat's queue: helplines shouldn't wait behind a reply being recorded
+    print(f"🚨 CRISIS DETECTED (fragment) for {first_name}")
+    await send_crisis_support(chat_id, first_name, received_at, helplines_sent)
+
+
+async def _alert_fragment(chat_id: int):
+    # A fragment with high-risk language: helplines now, the burst still waits on the LLM check
+    print(f"🚨 Crisis language (pre-screen) in chat {chat_id}, sending helplines")
+    await send_helplines(chat_id)
+
+
+coalescer = MessageCoalescer(scheduler, process_telegram_message, _escalate_burst, _alert_fragment)
+
+
+async def dispatch_text(chat_id: int, text: str, first_name: str, wait: bool = True) -> bool:
+    """
+    Queue a text message for processing. Plain messages go through the
+    coalescing window; commands flush any pending burst and run after it.
+    Returns False if the backlog is full and wait=False.
+    """
+    received_at = time.perf_counter()
+    if coalescer.enabled and not text.startswith("/"):
+        return await coalescer.add(chat_id, text, first_name, received_at, wait=wait)
+
+    coalescer.flush(chat_id)
+    return await scheduler.submit(
+        chat_id, process_telegram_message, chat_id, text, first_name, received_at, wait=wait
+    )
+
+
+# Poller leadership task, and the polling loop it runs while this worker leads
 polling_task = None
+poll_task = None
 
 
 async def poll_telegram():
     """Long polling loop to get Telegram updates."""
     print("🤖 Starting Telegram bot polling...")
-    offset = None
+    # Resume exactly where the last run stopped
+    offset = await update_dedup.load_offset()
 
     while True:
         try:
@@ -232,6 +497,10 @@ async def poll_telegram():
             if result.get("ok") and result.get("result"):
                 for update in result["result"]:
                     offset = update["update_id"] + 1
+                    update_dedup.set_offset(offset)
+
+                    if not await update_dedup.mark(update["update_id"]):
+                        continue
 
                     if "message" in update:
                         message = update["message"]
@@ -240,46 +509,131 @@ async def poll_telegram():
                         first_name = message.get("from", {}).get("first_name", "friend")
 
                         # Check if user sent a voice message while in clone mode
-                        if "voice" in message and chat_id in users_awaiting_voice:
+                        if "voice" in message and await is_awaiting_voice(chat_id):
                             voice_file_id = message["voice"]["file_id"]
+                            voice_duration = message["voice"].get("duration")
                             print(f"🎤 Voice message from {first_name} for cloning")
-                            asyncio.create_task(
-                                process_voice_clone(chat_id, voice_file_id, first_name)
+                            await scheduler.submit(
+                                chat_id, process_voice_clone, chat_id, voice_file_id, first_name, voice_duration
                             )
                         elif text:
                             print(f"📩 Message from {first_name}: {text[:50]}...")
-                            asyncio.create_task(
-                                process_telegram_message(chat_id, text, first_name)
-                            )
+                            await dispatch_text(chat_id, text, first_name)
+
+                await update_dedup.flush()
+
+            elif not result.get("ok"):
+                # e.g. 409 while a webhook is set, or 429: don't spin on the error
+                print(f"getUpdates error: {result.get('description')}")
+                await asyncio.sleep(result.get("parameters", {}).get("retry_after", 5))
 
         except Exception as e:
             print(f"Polling error: {e}")
             await asyncio.sleep(5)
 
 
+async def _stop(task: asyncio.Task):
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+async def stop_polling():
+    """Stop this worker's polling loop, if it's running."""
+    global poll_task
+    task, poll_task = poll_task, None
+    if task is not None:
+        await _stop(task)
+
+
+async def run_poller():
+    """
+    Poll Telegram while this process holds the poller lock. Every worker
+    runs this loop; the others stand by and take over if the leader dies.
+    """
+    global poll_task
+    lock = LeaderLock(get_state(), "telegram_poller", POLLER_LOCK_TTL_SECONDS)
+    try:
+        while True:
+            try:
+                webhook_mode = await get_state().get(WEBHOOK_MODE_KEY) is not None
+                if webhook_mode:
+                    await lock.release()
+                is_leader = not webhook_mode and await lock.acquire()
+
+                if is_leader and poll_task is None:
+                    print(f"👑 Poller lock acquired by {lock.owner}")
+                    print("🔄 Clearing webhook for polling mode...")
+                    await delete_webhook()
+                    poll_task = asyncio.create_task(poll_telegram())
+                elif not is_leader and poll_task is not None:
+                    print("Poller lock lost, stopping polling")
+                    await stop_polling()
+            except Exception as e:
+                print(f"Poller lock error: {e}")
+
+            # Renew well within the TTL
+            await asyncio.sleep(POLLER_LOCK_TTL_SECONDS / 3)
+    finally:
+        await stop_polling()
+        await lock.release()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Start polling on startup, stop on shutdown."""
+    """Start polling (on the elected worker) on startup, stop on shutdown."""
     global polling_task
 
-    print("🔄 Clearing webhook for polling mode...")
-    await delete_webhook()
+    await open_telegram_client()
 
-    polling_task = asyncio.create_task(poll_telegram())
+    background = [asyncio.create_task(checkin_engine.run())]
+    if TELEGRAM_MODE == "webhook":
+        print("🪝 Webhook mode: skipping polling and warm-ups")
+        _spawn(fallback_library.warm(render=False))
+    else:
+        polling_task = asyncio.create_task(run_poller())
+        background.append(asyncio.create_task(signed_url_pool.run_refresh_loop()))
+        _spawn(welcome_cache.warm())
+        _spawn(fallback_library.warm())
 
     yield
 
+    for task in background:
+        await _stop(task)
+    await signed_url_pool.close()
+
     if polling_task:
-        polling_task.cancel()
-        try:
-            await polling_task
-        except asyncio.CancelledError:
-            pass
+        await _stop(polling_task)
+
+    await coalescer.stop()
+    await broadcaster.stop()
+    await scheduler.stop()
+    await update_dedup.flush()
+    await close_telegram_client()
     print("👋 Bot stopped")
 
 
 app = FastAPI(title="Kalm API", version="1.0.0", lifespan=lifespan)
 
+metrics.register_collector("telegram_pool", get_telegram_pool_stats)
+metrics.register_collector("telegram_rate_limit", get_telegram_rate_limit_stats)
+metrics.register_collector("tts_cache", tts_cache.get_stats)
+metrics.register_collector("scheduler", scheduler.get_stats)
+metrics.register_collector("coalescer", coalescer.get_stats)
+metrics.register_collector("signed_url_pool", signed_url_pool.get_stats)
+metrics.register_collector("broadcast", broadcaster.get_stats)
+metrics.register_collector("checkins", checkin_engine.get_stats)
+metrics.register_collector("update_dedup", update_dedup.get_stats)
+metrics.register_collector("state", lambda: get_state().get_stats())
+metrics.register_collector("welcome_cache", welcome_cache.get_stats)
+metrics.register_collector("crisis_batcher", crisis_batcher.get_stats)
+metrics.register_collector("circuit", get_circuit_stats)
+metrics.register_collector("fallback_audio", fallback_library.get_stats)
+metrics.register_collector("voice_slots", voice_slots.get_stats)
+metrics.register_collector("voice_prep", get_voice_prep_stats)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -299,39 +653,54 @@ class SupportResponse(BaseModel):
     message: str
 
 
+class SupportGroup(BaseModel):
+    addiction_type: str
+    telegram_chat_ids: list[str]
+
+
+class BatchSupportRequest(BaseModel):
+    groups: list[SupportGroup]
+
+
 @app.get("/")
 async def root():
     return {"message": "Kalm API is running"}
 
 
 @app.post("/api/telegram/webhook")
-async def telegram_webhook(request: Request, background_tasks: BackgroundTasks):
+async def telegram_webhook(request: Request):
     """Handle incoming Telegram updates (for production with webhook)."""
     try:
         data = await request.json()
 
+        # Telegram redelivers slow webhooks - only process each update once
+        update_id = data.get("update_id")
+        if update_id is not None and not await update_dedup.mark(update_id):
+            return {"ok": True}
+
         if "message" in data:
             message = data["message"]
             chat_id = message["chat"]["id"]
             text = message.get("text", "")
             first_name = message.get("from", {}).get("first_name", "friend")
 
+            accepted = True
+
             # Check if user sent a voice message while in clone mode
-            if "voice" in message and chat_id in users_awaiting_voice:
+            if "voice" in message and await is_awaiting_voice(chat_id):
                 voice_file_id = message["voice"]["file_id"]
-                background_tasks.add_task(
-                    process_voice_clone,
-                    chat_id,
-                    voice_file_id,
-                    first_name
+                voice_duration = message["voice"].get("duration")
+                accepted = await scheduler.submit(
+                    chat_id, process_voice_clone, chat_id, voice_file_id, first_name, voice_duration, wait=False
                 )
             elif text:
-                background_tasks.add_task(
-                    process_telegram_message,
-                    chat_id,
-                    text,
-                    first_name
-                )
+                accepted = await dispatch_text(chat_id, text, first_name, wait=False)
+
+            if not accepted:
+                # Backlog is full - Telegram will redeliver the update later
+                if update_id is not None:
+                    await update_dedup.unmark(update_id)
+                return JSONResponse(status_code=503, content={"ok": False})
 
         return {"ok": True}
 
@@ -342,28 +711,37 @@ async def telegram_webhook(request: Request, background_tasks: BackgroundTasks):
 
 @app.post("/api/telegram/set-webhook")
 async def set_telegram_webhook(webhook_url: str):
-    """Set the Telegram webhook URL (stops polling, enables webhook mode)."""
-    global polling_task
-    if polling_task:
-        polling_task.cancel()
+    """Set the Telegram webhook URL (stops polling on every worker, enables webhook mode)."""
+    await get_state().set(WEBHOOK_MODE_KEY, webhook_url)
+    # Stop polling here straight away; other workers stop at their next lock check
+    await stop_polling()
     result = await set_webhook(webhook_url)
     return result
 
 
+@app.post("/api/telegram/delete-webhook")
+async def delete_telegram_webhook():
+    """Remove the Telegram webhook and go back to polling."""
+    await get_state().delete(WEBHOOK_MODE_KEY)
+    return await delete_webhook()
+
+
 @app.post("/api/send-support", response_model=SupportResponse)
 async def send_support(request: SupportRequest):
     """Send a supportive voice message via Telegram (manual trigger)."""
+    received_at = time.perf_counter()
     try:
         response_text = await generate_supportive_response(
             f"I'm struggling with {request.addiction_type}",
             "friend"
         )
-        audio_bytes = generate_voice_message(response_text)
+        audio_bytes = await generate_voice_message(response_text)
 
         await send_voice_message(
             chat_id=request.telegram_chat_id,
             audio_bytes=audio_bytes,
         )
+        _record_voice_note("support", received_at)
 
         return SupportResponse(
             success=True,
@@ -374,34 +752,84 @@ async def send_support(request: SupportRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/api/conversation/start")
-async def start_conversation():
-    ELEVENLABS_AGENT_ID = os.getenv("ELEVENLABS_AGENT_ID")
-    """Generate a signed URL for ElevenLabs Conversational AI."""
-    if not ELEVENLABS_AGENT_ID:
-        raise HTTPException(status_code=500, detail="ELEVENLABS_AGENT_ID not configured")
+@app.post("/api/send-support/batch", status_code=202)
+async def send_support_batch(request: BatchSupportRequest):
+    """
+    Send supportive voice notes to many chats. Each addiction type is
+    generated once and fanned out; poll the returned job for progress.
+    """
+    groups: dict[str, list[str]] = {}
+    for group in request.groups:
+        groups.setdefault(group.addiction_type, []).extend(group.telegram_chat_ids)
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://api.elevenlabs.io/v1/convai/conversation/get_signed_url",
-                params={"agent_id": ELEVENLABS_AGENT_ID},
-                headers={"xi-api-key": os.getenv("ELEVENLABS_API_KEY")},
-                timeout=30.0,
-            )
+        job = await broadcaster.start(groups)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"job_id": job.id, "status": job.status, "total": len(job.results)}
 
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"ElevenLabs API error: {response.text}"
-                )
 
-            return response.json()
+@app.get("/api/send-support/batch/{job_id}")
+async def send_support_batch_status(job_id: str):
+    """Progress of a batch send, with per-recipient results once it has finished."""
+    job = await broadcaster.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
-    except httpx.RequestError as e:
-        raise HTTPException(status_code=500, detail=f"Request failed: {str(e)}")
+
+@app.post("/api/conversation/start")
+async def start_conversation():
+    """Hand out a signed URL for ElevenLabs Conversational AI (pre-fetched when possible)."""
+    try:
+        return await signed_url_pool.get()
+    except SignedUrlError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
 
 @app.get("/health")
 async def health():
     return {"status": "healthy"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus text-format metrics for every pipeline stage."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/telegram/pool-stats")
+async def telegram_pool_stats():
+    """Connection pool stats for the shared Telegram client."""
+    return get_telegram_pool_stats()
+
+
+@app.get("/api/telegram/rate-limit-stats")
+async def telegram_rate_limit_stats():
+    """Throttling and 429 retry counters for outbound Telegram messages."""
+    return get_telegram_rate_limit_stats()
+
+
+@app.get("/api/tts/cache-stats")
+async def tts_cache_stats():
+    """Hit/miss counters and sizes for the synthesized audio cache."""
+    return tts_cache.get_stats()
+
+
+@app.get("/api/scheduler/stats")
+async def scheduler_stats():
+    """Queue depth, concurrency and wait-time stats for message processing."""
+    return scheduler.get_stats()
+
+
+@app.get("/api/telegram/dedup-stats")
+async def telegram_dedup_stats():
+    """Duplicate update counters and the persisted polling offset."""
+    return update_dedup.get_stats()
+
+
+@app.get("/api/resilience/stats")
+async def resilience_stats():
+    """Circuit breaker state per upstream and pre-rendered fallback usage."""
+    return {"circuits": get_circuit_stats(), "fallback_audio": fallback_library.get_stats()}
@@ -0,0 +1,180 @@
+"""
+Helpers for the audio we synthesize and send: Ogg/Opus page parsing,
+duration metadata and stitching of per-sentence segments.
+"""
+import struct
+
+OPUS_SAMPLE_RATE = 48000
+
+_PAGE_HEADER = struct.Struct("<4sBBqIIIB")
+_EOS = 0x04
+_BOS = 0x02
+
+
+def _crc_table() -> list[int]:
+    table = []
+    for i in range(256):
+        r = i << 24
+        for _ in range(8):
+            r = ((r << 1) ^ 0x04C11DB7) if r & 0x80000000 else (r << 1)
+        table.append(r & 0xFFFFFFFF)
+    return table
+
+
+_CRC_TABLE = _crc_table()
+
+
+def _ogg_crc(data: bytes) -> int:
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ _CRC_TABLE[((crc >> 24) & 0xFF) ^ byte]
+    return crc
+
+
+class OggPage:
+    def __init__(self, header_type: int, granule: int, serial: int, sequence: int, segments: bytes, body: bytes):
+        self.header_type = header_type
+        self.granule = granule
+        self.serial = serial
+        self.sequence = sequence
+        self.segments = segments
+        self.body = body
+
+    def to_bytes(self) -> bytes:
+        header = _PAGE_HEADER.pack(
+            b"OggS", 0, self.header_type, self.granule, self.serial, self.sequence, 0, len(self.segments)
+        )
+        page = bytearray(header + self.segments + self.body)
+        struct.pack_into("<I", page, 22, _ogg_crc(page))
+        return bytes(page)
+
+
+def is_ogg(data: bytes) -> bool:
+    return data[:4] == b"OggS"
+
+
+def parse_ogg_pages(data: bytes) -> list[OggPage]:
+    """Split an Ogg bitstream into pages. Raises ValueError on malformed input."""
+    pages = []
+    offset = 0
+    while offset < len(data):
+        if len(data) - offset < _PAGE_HEADER.size:
+            raise ValueError("Truncated Ogg page header")
+        capture, version, header_type, granule, serial, sequence, _, count = _PAGE_HEADER.unpack_from(
+            data, offset
+        )
+        if capture != b"OggS" or version != 0:
+            raise ValueError("Not an Ogg page")
+        seg_start = offset + _PAGE_HEADER.size
+        segments = data[seg_start:seg_start + count]
+        body_len = sum(segments)
+        body_start = seg_start + count
+        body = data[body_start:body_start + body_len]
+        if len(segments) != count or len(body) != body_len:
+            raise ValueError("Truncated Ogg page")
+        pages.append(OggPage(header_type, granule, serial, sequence, segments, body))
+        offset = body_start + body_len
+    return pages
+
+
+def _opus_pre_skip(pages: list[OggPage]) -> int:
+    head = pages[0].body if pages else b""
+    if not head.startswith(b"OpusHead") or len(head) < 12:
+        raise ValueError("Missing OpusHead")
+    return struct.unpack_from("<H", head, 10)[0]
+
+
+def _split_headers(pages: list[OggPage]) -> tuple[list[OggPage], list[OggPage]]:
+    """Opus header pages (OpusHead, OpusTags) carry granule 0; audio follows."""
+    count = 1
+    while count < len(pages) and pages[count].granule == 0:
+        count += 1
+    return pages[:count], pages[count:]
+
+
+def ogg_opus_duration(data: bytes) -> float | None:
+    """Playback length in seconds from the last granule position, or None if unknown."""
+    try:
+        pages = parse_ogg_pages(data)
+        pre_skip = _opus_pre_skip(pages)
+    except ValueError:
+        return None
+    granules = [p.granule for p in pages if p.granule > 0]
+    if not granules:
+        return None
+    return max(0, granules[-1] - pre_skip) / OPUS_SAMPLE_RATE
+
+
+def truncate_ogg_opus(data: bytes, max_seconds: float) -> bytes:
+    """
+    Cut an Ogg/Opus file after the first page that reaches `max_seconds`
+    (page granularity, no re-encoding). Raises ValueError on malformed input.
+    """
+    pages = parse_ogg_pages(data)
+    limit = _opus_pre_skip(pages) + int(max_seconds * OPUS_SAMPLE_RATE)
+    headers, audio = _split_headers(pages)
+
+    kept = list(headers)
+    for page in audio:
+        kept.append(page)
+        if page.granule >= limit:
+            break
+    if len(kept) == len(pages):
+        return data
+
+    kept[-1].header_type |= _EOS
+    return b"".join(page.to_bytes() for page in kept)
+
+
+def concat_ogg_opus(segments: list[bytes]) -> bytes:
+    """
+    Merge several Ogg/Opus files into one logical stream: keep the first
+    file's headers, then re-number pages and shift granule positions of the
+    following files so players see one continuous voice note.
+    """
+    out = []
+    sequence = 0
+    granule_offset = 0
+    serial = None
+
+    for index, segment in enumerate(segments):
+        pages = parse_ogg_pages(segment)
+        _opus_pre_skip(pages)
+        headers, audio = _split_headers(pages)
+
+        if index == 0:
+            serial = pages[0].serial
+            for page in headers:
+                page.serial = serial
+                page.sequence = sequence
+                sequence += 1
+                out.append(page)
+
+        last_granule = 0
+        for page in audio:
+            page.header_type &= ~(_BOS | _EOS)
+            page.serial = serial
+            page.sequence = sequence
+            sequence += 1
+            if page.granule != -1:
+                last_granule = page.granule
+                page.granule += granule_offset
+            out.append(page)
+        granule_offset += last_granule
+
+    if out:
+        out[-1].header_type |= _EOS
+    return b"".join(page.to_bytes() for page in out)
+
+
+def concat_audio(segments: list[bytes]) -> bytes:
+    """Stitch synthesized segments into one clip."""
+    if len(segments) == 1:
+        return segments[0]
+    if segments and all(is_ogg(s) for s in segments):
+        try:
+            return concat_ogg_opus(segments)
+        except ValueError as e:
+            print(f"Ogg concat error, falling back to raw join: {e}")
+    # MP3 frames concatenate cleanly
+    return b"".join(segments)
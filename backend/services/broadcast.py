@@ -0,0 +1,198 @@
+"""
+Bulk support voice notes: one generated reply and voice note per addiction
+type, uploaded to Telegram once and fanned out to every recipient by file_id.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+
+from services.openai_service import generate_supportive_response
+from services.elevenlabs import generate_voice_message
+from services.telegram_service import send_voice_message, TokenBucket
+from services.state import get_state
+
+# Sends in flight per job (the Telegram rate limiter still paces them)
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "8"))
+
+# Broadcast sends per second across all jobs, kept well under Telegram's ~30/s
+# per bot so interactive replies and crisis helplines aren't queued behind them
+BROADCAST_SENDS_PER_SECOND = float(os.getenv("BROADCAST_SENDS_PER_SECOND", "10"))
+BROADCAST_MAX_RECIPIENTS = int(os.getenv("BROADCAST_MAX_RECIPIENTS", "10000"))
+
+# How long job progress and results can be fetched after the job finishes
+BROADCAST_RESULT_TTL_SECONDS = float(os.getenv("BROADCAST_RESULT_TTL_SECONDS", str(24 * 60 * 60)))
+
+# Progress counters are written to the shared state store at most this often;
+# per-recipient results only once the job finishes
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "1.0"))
+
+
+class BroadcastJob:
+    def __init__(self, groups: dict[str, list[str]]):
+        self.id = uuid.uuid4().hex
+        self.groups = groups
+        self.status = "queued"
+        self.created_at = time.time()
+        self.finished_at = None
+        self.results: dict[str, dict] = {
+            chat_id: {"addiction_type": addiction_type, "status": "pending"}
+            for addiction_type, chat_ids in groups.items()
+            for chat_id in chat_ids
+        }
+        self.sent = 0
+        self.failed = 0
+
+    def record(self, chat_id: str, ok: bool, error: str | None = None):
+        result = self.results[chat_id]
+        result["status"] = "sent" if ok else "failed"
+        if error:
+            result["error"] = error
+        if ok:
+            self.sent += 1
+        else:
+            self.failed += 1
+
+    def to_dict(self, include_results: bool = True) -> dict:
+        total = len(self.results)
+        progress = {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "total": total,
+            "sent": self.sent,
+            "failed": self.failed,
+            "pending": total - self.sent - self.failed,
+        }
+        if include_results:
+            progress["results"] = self.results
+        return progress
+
+
+class BroadcastManager:
+    """Runs broadcast jobs in the background and publishes their progress."""
+
+    def __init__(self, concurrency: int = BROADCAST_CONCURRENCY, sends_per_second: float = BROADCAST_SENDS_PER_SECOND):
+        self.concurrency = concurrency
+        # Shared by every job, so concurrent jobs don't add up past the rate
+        self._pacer = TokenBucket(sends_per_second, 1)
+        self._tasks: dict[str, asyncio.Task] = {}
+        self.stats = {"jobs": 0, "sent": 0, "failed": 0, "generated": 0}
+
+    async def start(self, groups: dict[str, list[str]]) -> BroadcastJob:
+        """
+        Start a job for {addiction_type: [chat_id, ...]}. Types are matched
+        case-insensitively and duplicate chat IDs are sent to once.
+        """
+        merged: dict[str, list[str]] = {}
+        seen = set()
+        for addiction_type, chat_ids in groups.items():
+            key = " ".join(addiction_type.lower().split())
+            for chat_id in chat_ids:
+                chat_id = str(chat_id)
+                if chat_id not in seen:
+                    seen.add(chat_id)
+                    merged.setdefault(key, []).append(chat_id)
+
+        if len(seen) > BROADCAST_MAX_RECIPIENTS:
+            raise ValueError(f"At most {BROADCAST_MAX_RECIPIENTS} recipients per job")
+
+        job = BroadcastJob(merged)
+        self.stats["jobs"] += 1
+        await self._publish(job, include_results=False)
+        task = self._tasks[job.id] = asyncio.create_task(self._run(job))
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+        return job
+
+    async def _publish(self, job: BroadcastJob, include_results: bool = True):
+        try:
+            await get_state().set(
+                f"broadcast:{job.id}",
+                json.dumps(job.to_dict(include_results)),
+                ex=BROADCAST_RESULT_TTL_SECONDS,
+            )
+        except Exception as e:
+            print(f"Broadcast progress save error for {job.id}: {e}")
+
+    async def get(self, job_id: str) -> dict | None:
+        """Latest progress for a job (from any worker); results are included once it has finished."""
+        raw = await get_state().get(f"broadcast:{job_id}")
+        return json.loads(raw) if raw else None
+
+    async def _send(self, job: BroadcastJob, chat_id: str, audio_bytes: bytes) -> bool:
+        await asyncio.sleep(self._pacer.reserve())
+        try:
+            await send_voice_message(chat_id=chat_id, audio_bytes=audio_bytes)
+            job.record(chat_id, True)
+            self.stats["sent"] += 1
+            return True
+        except Exception as e:
+            job.record(chat_id, False, str(e))
+            self.stats["failed"] += 1
+            return False
+
+    async def _run_group(self, job: BroadcastJob, addiction_type: str, chat_ids: list[str], limit: asyncio.Semaphore):
+        try:
+            text = await generate_supportive_response(f"I'm struggling with {addiction_type}", "friend")
+            audio_bytes = await generate_voice_message(text)
+            self.stats["generated"] += 1
+        except Exception as e:
+            for chat_id in chat_ids:
+                job.record(chat_id, False, f"Generation failed: {e}")
+            self.stats["failed"] += len(chat_ids)
+            return
+
+        # Upload to the first recipient that accepts it; the rest are sent the file_id
+        remaining = list(chat_ids)
+        while remaining:
+            if await self._send(job, remaining.pop(0), audio_bytes):
+                break
+
+        async def send(chat_id: str):
+            async with limit:
+                await self._send(job, chat_id, audio_bytes)
+
+        await asyncio.gather(*(send(chat_id) for chat_id in remaining))
+
+    async def _report_progress(self, job: BroadcastJob):
+        while True:
+            await asyncio.sleep(BROADCAST_PROGRESS_INTERVAL)
+            await self._publish(job, include_results=False)
+
+    async def _run(self, job: BroadcastJob):
+        job.status = "running"
+        await self._publish(job, include_results=False)
+        reporter = asyncio.create_task(self._report_progress(job))
+        limit = asyncio.Semaphore(self.concurrency)
+        try:
+            await asyncio.gather(
+                *(self._run_group(job, addiction_type, chat_ids, limit) for addiction_type, chat_ids in job.groups.items())
+            )
+            job.status = "done"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            print(f"Broadcast {job.id} error: {e}")
+            job.status = "failed"
+        finally:
+            reporter.cancel()
+            job.finished_at = time.time()
+            await self._publish(job)
+            print(f"📣 Broadcast {job.id} {job.status}: {job.sent} sent, {job.failed} failed")
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["running"] = len(self._tasks)
+        return stats
+
+
+broadcaster = BroadcastManager()
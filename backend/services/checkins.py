@@ -0,0 +1,454 @@
+"""
+Proactive daily check-in voice notes at each user's local time.
+
+Schedules are persisted in SQLite (one host) or, with STATE_BACKEND=redis,
+in Redis so that every node sees every opt-in, and are mirrored into one
+in-memory heap ordered by the next send time, so a single timer loop serves
+every user. Each day's voice note is rendered once, ahead of the send window,
+and sends are paced to leave Telegram headroom for interactive replies.
+Only the worker holding the check-in lock runs the loop.
+"""
+import os
+import re
+import time
+import heapq
+import sqlite3
+import asyncio
+import threading
+from datetime import datetime, timedelta, timezone, time as dt_time
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from services.openai_service import complete_supportive_response
+from services.elevenlabs import generate_voice_message
+from services.telegram_service import send_voice_message
+from services.fallback_audio import fallback_library
+from services.state import get_state, LeaderLock, STATE_BACKEND, REDIS_URL, STATE_KEY_PREFIX
+
+# "sqlite" (one host) or "redis" (shared by every node). The check-in loop's
+# leader is elected across everything sharing the state store, so with
+# STATE_BACKEND=redis the schedules must be in Redis too.
+CHECKIN_STORE_BACKEND = os.getenv("CHECKIN_STORE_BACKEND", "redis" if STATE_BACKEND == "redis" else "sqlite").lower()
+CHECKINS_DB = os.getenv("CHECKINS_DB", os.path.join(os.path.dirname(__file__), "..", "checkins.db"))
+
+CHECKIN_DEFAULT_TIME = os.getenv("CHECKIN_DEFAULT_TIME", "09:00")
+CHECKIN_DEFAULT_TIMEZONE = os.getenv("CHECKIN_DEFAULT_TIMEZONE", "UTC")
+
+# Check-in sends per second (Telegram allows ~30 messages/s per bot in total)
+CHECKIN_SENDS_PER_SECOND = float(os.getenv("CHECKIN_SENDS_PER_SECOND", "10"))
+CHECKIN_SEND_CONCURRENCY = int(os.getenv("CHECKIN_SEND_CONCURRENCY", "8"))
+
+# Render the day's voice note this long before the first send that needs it
+CHECKIN_PRERENDER_SECONDS = float(os.getenv("CHECKIN_PRERENDER_SECONDS", "1800"))
+
+# Check-ins missed by more than this (e.g. during downtime) are skipped to the next day
+CHECKIN_MAX_LATE_SECONDS = float(os.getenv("CHECKIN_MAX_LATE_SECONDS", "7200"))
+
+# After a failed render, sends use the generic check-in clip for this long before retrying
+CHECKIN_RENDER_RETRY_SECONDS = float(os.getenv("CHECKIN_RENDER_RETRY_SECONDS", "120"))
+
+# How often schedule changes made by other workers are picked up
+CHECKIN_SYNC_SECONDS = float(os.getenv("CHECKIN_SYNC_SECONDS", "30"))
+
+CHECKIN_PROMPT = """Write a short daily check-in for someone in addiction recovery. Wish them a good day, remind them that they're not alone, and invite them to reply if they need support today. Keep it under 60 words.
+
+Do not greet them by name and do not use any name."""
+
+_TIME = re.compile(r"^([01]?\d|2[0-3])[:.]([0-5]\d)$")
+_OFFSET = re.compile(r"^(?:utc|gmt)?([+-])(\d{1,2})(?::?(\d{2}))?$", re.IGNORECASE)
+
+
+def parse_timezone(name: str):
+    """An IANA zone ("Europe/London") or a UTC offset ("+2", "UTC-05:30"); None if invalid."""
+    match = _OFFSET.match(name)
+    if match:
+        sign, hours, minutes = match.groups()
+        offset = timedelta(hours=int(hours), minutes=int(minutes or 0))
+        if offset > timedelta(hours=14):
+            return None
+        return timezone(-offset if sign == "-" else offset)
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def parse_send_time(text: str) -> tuple[int, int] | None:
+    match = _TIME.match(text)
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def next_occurrence(send_time: str, tz_name: str, after: float) -> float:
+    """Epoch seconds of the next HH:MM in the given zone strictly after `after`."""
+    hour, minute = parse_send_time(send_time)
+    zone = parse_timezone(tz_name) or timezone.utc
+    day = datetime.fromtimestamp(after, zone).date()
+    while True:
+        candidate = datetime.combine(day, dt_time(hour, minute), tzinfo=zone).timestamp()
+        if candidate > after:
+            return candidate
+        day += timedelta(days=1)
+
+
+class CheckinStore:
+    """Opted-in chats and their next due time, in SQLite (WAL)."""
+
+    def __init__(self, path: str = CHECKINS_DB):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS checkins (
+                chat_id TEXT PRIMARY KEY,
+                first_name TEXT NOT NULL,
+                send_time TEXT NOT NULL,
+                timezone TEXT NOT NULL,
+                next_due REAL NOT NULL,
+                enabled INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_checkins_updated ON checkins (updated_at)")
+
+    def upsert(self, chat_id: str, first_name: str, send_time: str, tz_name: str, next_due: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkins VALUES (?, ?, ?, ?, ?, 1, ?)",
+                (chat_id, first_name, send_time, tz_name, next_due, time.time()),
+            )
+
+    def disable(self, chat_id: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE checkins SET enabled = 0, updated_at = ? WHERE chat_id = ? AND enabled = 1",
+                (time.time(), chat_id),
+            )
+            return cursor.rowcount > 0
+
+    def set_next_due_many(self, updates: list[tuple[str, float]]):
+        """Write (chat_id, next_due) pairs in one transaction."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "UPDATE checkins SET next_due = ?, updated_at = ? WHERE chat_id = ?",
+                    [(next_due, now, chat_id) for chat_id, next_due in updates],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def changed_since(self, since: float) -> list[tuple]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT chat_id, first_name, send_time, timezone, next_due, enabled FROM checkins WHERE updated_at >= ?",
+                (since,),
+            ).fetchall()
+
+
+class RedisCheckinStore:
+    """
+    Opted-in chats in Redis: one hash per chat, plus a sorted set of chat IDs
+    by last update so changed_since is a range query.
+    """
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = STATE_KEY_PREFIX):
+        try:
+            import redis
+        except ImportError:
+            raise Exception("CHECKIN_STORE_BACKEND=redis requires the 'redis' package")
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._prefix = f"{prefix}checkin:"
+        self._updated = f"{prefix}checkins:updated"
+
+    def upsert(self, chat_id: str, first_name: str, send_time: str, tz_name: str, next_due: float):
+        now = time.time()
+        pipe = self._redis.pipeline()
+        pipe.hset(self._prefix + chat_id, mapping={
+            "first_name": first_name,
+            "send_time": send_time,
+            "timezone": tz_name,
+            "next_due": next_due,
+            "enabled": 1,
+        })
+        pipe.zadd(self._updated, {chat_id: now})
+        pipe.execute()
+
+    def disable(self, chat_id: str) -> bool:
+        if self._redis.hget(self._prefix + chat_id, "enabled") != "1":
+            return False
+        pipe = self._redis.pipeline()
+        pipe.hset(self._prefix + chat_id, "enabled", 0)
+        pipe.zadd(self._updated, {chat_id: time.time()})
+        pipe.execute()
+        return True
+
+    def set_next_due_many(self, updates: list[tuple[str, float]]):
+        """Write (chat_id, next_due) pairs in one round trip, leaving the rest of each row alone."""
+        now = time.time()
+        pipe = self._redis.pipeline()
+        for chat_id, next_due in updates:
+            pipe.hset(self._prefix + chat_id, "next_due", next_due)
+            pipe.zadd(self._updated, {chat_id: now})
+        pipe.execute()
+
+    def changed_since(self, since: float) -> list[tuple]:
+        chat_ids = self._redis.zrangebyscore(self._updated, since, "+inf")
+        pipe = self._redis.pipeline()
+        for chat_id in chat_ids:
+            pipe.hgetall(self._prefix + chat_id)
+        rows = []
+        for chat_id, row in zip(chat_ids, pipe.execute()):
+            if row:
+                rows.append((
+                    chat_id, row["first_name"], row["send_time"], row["timezone"],
+                    float(row["next_due"]), int(row["enabled"]),
+                ))
+        return rows
+
+
+class CheckinEngine:
+    def __init__(self, sends_per_second: float = CHECKIN_SENDS_PER_SECOND):
+        self.sends_per_second = sends_per_second
+        self._store: CheckinStore | RedisCheckinStore | None = None
+
+        # chat_id -> (next_due, first_name, send_time, timezone); the heap may hold
+        # stale (due, chat_id) pairs, which are skipped when they don't match
+        self._entries: dict[str, tuple] = {}
+        self._heap: list[tuple[float, str]] = []
+        self._synced_at = 0.0
+
+        self._audio: dict[str, asyncio.Task] = {}
+        self._render_failed_at: dict[str, float] = {}
+        self._uploaded: set[str] = set()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self.stats = {
+            "sent": 0,
+            "failed": 0,
+            "skipped_late": 0,
+            "opted_out_blocked": 0,
+            "rendered": 0,
+            "render_errors": 0,
+            "fallback_sent": 0,
+        }
+
+    @property
+    def store(self) -> CheckinStore | RedisCheckinStore:
+        if self._store is None:
+            self._store = RedisCheckinStore() if CHECKIN_STORE_BACKEND == "redis" else CheckinStore()
+        return self._store
+
+    # Opt-in / opt-out (any worker)
+
+    async def opt_in(self, chat_id, first_name: str, send_time: str, tz_name: str) -> float:
+        next_due = next_occurrence(send_time, tz_name, time.time())
+        await asyncio.to_thread(self.store.upsert, str(chat_id), first_name, send_time, tz_name, next_due)
+        self._wakeup.set()
+        return next_due
+
+    async def opt_out(self, chat_id) -> bool:
+        disabled = await asyncio.to_thread(self.store.disable, str(chat_id))
+        self._wakeup.set()
+        return disabled
+
+    # Timer loop (leader only)
+
+    async def _sync(self):
+        """Mirror schedule rows changed since the last sync into the heap."""
+        now = time.time()
+        # Small overlap so rows written during the previous sync aren't missed
+        rows = await asyncio.to_thread(self.store.changed_since, self._synced_at - 5)
+        self._synced_at = now
+        for chat_id, first_name, send_time, tz_name, next_due, enabled in rows:
+            current = self._entries.get(chat_id)
+            if not enabled:
+                self._entries.pop(chat_id, None)
+                continue
+            self._entries[chat_id] = (next_due, first_name, send_time, tz_name)
+            if current is None or current[0] != next_due:
+                heapq.heappush(self._heap, (next_due, chat_id))
+
+    def _pop_due(self, now: float) -> list[tuple[str, tuple]]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            next_due, chat_id = heapq.heappop(self._heap)
+            entry = self._entries.get(chat_id)
+            if entry is not None and entry[0] == next_due:
+                due.append((chat_id, entry))
+        return due
+
+    def _reschedule(self, chat_id: str, entry: tuple, now: float) -> float:
+        _, first_name, send_time, tz_name = entry
+        next_due = next_occurrence(send_time, tz_name, now)
+        self._entries[chat_id] = (next_due, first_name, send_time, tz_name)
+        heapq.heappush(self._heap, (next_due, chat_id))
+        return next_due
+
+    @staticmethod
+    def _day_key(due: float) -> str:
+        return datetime.fromtimestamp(due, timezone.utc).strftime("%Y-%m-%d")
+
+    async def _render(self, day: str) -> bytes:
+        # Both calls raise on upstream failure, so a canned reply is never cached as the day's check-in
+        try:
+            text = await complete_supportive_response(CHECKIN_PROMPT, "friend")
+            audio_bytes = await generate_voice_message(text)
+        except Exception:
+            self.stats["render_errors"] += 1
+            self._render_failed_at[day] = time.monotonic()
+            raise
+        self.stats["rendered"] += 1
+        print(f"🌅 Rendered check-in audio for {day}")
+        return audio_bytes
+
+    def _audio_for(self, day: str) -> asyncio.Task:
+        """The day's voice note, rendered once (single-flight), retried a while after a failure."""
+        task = self._audio.get(day)
+        failed = task is not None and task.done() and (task.cancelled() or task.exception())
+        if task is None or (
+            failed and time.monotonic() - self._render_failed_at.get(day, 0.0) >= CHECKIN_RENDER_RETRY_SECONDS
+        ):
+            task = self._audio[day] = asyncio.create_task(self._render(day))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            # Keep only the last couple of days
+            for old in sorted(self._audio)[:-2]:
+                self._audio.pop(old, None)
+                self._render_failed_at.pop(old, None)
+        return task
+
+    async def _tick(self) -> float:
+        """Queue due check-ins and return how long to sleep before the next tick."""
+        await self._sync()
+        now = time.time()
+
+        updates = []
+        for chat_id, entry in self._pop_due(now):
+            if now - entry[0] > CHECKIN_MAX_LATE_SECONDS:
+                self.stats["skipped_late"] += 1
+            else:
+                self._queue.put_nowait((chat_id, entry[1], self._day_key(entry[0])))
+            updates.append((chat_id, self._reschedule(chat_id, entry, now)))
+        if updates:
+            await asyncio.to_thread(self.store.set_next_due_many, updates)
+
+        delay = CHECKIN_SYNC_SECONDS
+        if self._heap:
+            next_due = self._heap[0][0]
+            delay = min(delay, max(0.0, next_due - now))
+            if self._day_key(next_due) not in self._audio:
+                # Start rendering ahead of the next send window
+                if next_due - now <= CHECKIN_PRERENDER_SECONDS:
+                    self._audio_for(self._day_key(next_due))
+                else:
+                    delay = min(delay, next_due - CHECKIN_PRERENDER_SECONDS - now)
+        return delay
+
+    async def _run_timer(self):
+        while True:
+            try:
+                delay = await self._tick()
+            except Exception as e:
+                print(f"Check-in timer error: {e}")
+                delay = CHECKIN_SYNC_SECONDS
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _send(self, chat_id: str, first_name: str, audio_bytes: bytes) -> bool:
+        try:
+            await send_voice_message(chat_id=chat_id, audio_bytes=audio_bytes, caption=f"Your daily check-in, {first_name} 💚")
+            self.stats["sent"] += 1
+            return True
+        except Exception as e:
+            self.stats["failed"] += 1
+            print(f"Check-in send error for {chat_id}: {e}")
+            if "blocked" in str(e).lower() or "deactivated" in str(e).lower():
+                try:
+                    await asyncio.to_thread(self.store.disable, chat_id)
+                    self.stats["opted_out_blocked"] += 1
+                except Exception as store_error:
+                    print(f"Check-in opt-out error for {chat_id}: {store_error}")
+            return False
+
+    async def _run_sender(self):
+        """Drain due check-ins at a steady pace."""
+        limit = asyncio.Semaphore(CHECKIN_SEND_CONCURRENCY)
+        in_flight = set()
+
+        async def send(chat_id, first_name, audio_bytes) -> bool:
+            async with limit:
+                return await self._send(chat_id, first_name, audio_bytes)
+
+        try:
+            while True:
+                chat_id, first_name, day = await self._queue.get()
+                audio_key = day
+                try:
+                    audio_bytes = await self._audio_for(day)
+                except Exception as e:
+                    # The generic check-in clip, never the reply clip or a canned reply
+                    audio_bytes = fallback_library.get("checkin")
+                    if audio_bytes is None:
+                        print(f"Check-in audio error for {day}: {e}")
+                        self.stats["failed"] += 1
+                        continue
+                    audio_key = "fallback"
+                    self.stats["fallback_sent"] += 1
+
+                if audio_key not in self._uploaded:
+                    # First send uploads; the rest reuse the registered file_id. Until
+                    # one upload succeeds (e.g. the first chat blocked the bot) they stay sequential
+                    if await send(chat_id, first_name, audio_bytes):
+                        self._uploaded.add(audio_key)
+                else:
+                    task = asyncio.create_task(send(chat_id, first_name, audio_bytes))
+                    in_flight.add(task)
+                    task.add_done_callback(in_flight.discard)
+
+                await asyncio.sleep(1 / self.sends_per_second)
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+    async def run(self, lock_ttl: float = 30.0):
+        """Run the timer and sender while this process holds the check-in lock."""
+        lock = LeaderLock(get_state(), "checkins", lock_ttl)
+        workers: list[asyncio.Task] = []
+        try:
+            while True:
+                try:
+                    is_leader = await lock.acquire()
+                    if is_leader and not workers:
+                        print("⏰ Check-in scheduler started on this worker")
+                        self._entries.clear()
+                        self._heap.clear()
+                        self._synced_at = 0.0
+                        workers = [asyncio.create_task(self._run_timer()), asyncio.create_task(self._run_sender())]
+                    elif not is_leader and workers:
+                        for task in workers:
+                            task.cancel()
+                        await asyncio.gather(*workers, return_exceptions=True)
+                        workers = []
+                except Exception as e:
+                    print(f"Check-in lock error: {e}")
+                await asyncio.sleep(lock_ttl / 3)
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await lock.release()
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["scheduled"] = len(self._entries)
+        stats["queued"] = self._queue.qsize()
+        return stats
+
+
+checkin_engine = CheckinEngine()
@@ -0,0 +1,190 @@
+"""
+Per-chat coalescing of rapid-fire messages: fragments that arrive within a
+quiet window are answered once, as one combined message, while each
+fragment is still screened for crisis language the moment it arrives.
+"""
+import os
+import time
+import asyncio
+
+from services.crisis_classifier import prescreen, CRISIS
+from services.openai_service import detect_crisis
+
+# Respond once no new message has arrived for this long (0 disables coalescing).
+# Every message waits at least this long before its reply starts (only the
+# crisis check runs meanwhile), so the window trades single-message latency
+# for fewer replies to bursts: 400 ms catches pasted or split messages, while
+# slower typists need 1500+ ms. `benchmarks.load_test` measures it by default.
+COALESCE_QUIET_MS = float(os.getenv("COALESCE_QUIET_MS", "400"))
+
+# Never hold a burst longer than this, even if messages keep coming
+COALESCE_MAX_WAIT_MS = float(os.getenv("COALESCE_MAX_WAIT_MS", "6000"))
+
+# Respond straight away once a burst has this many fragments
+COALESCE_MAX_MESSAGES = int(os.getenv("COALESCE_MAX_MESSAGES", "8"))
+
+
+class Burst:
+    def __init__(self, first_name: str, received_at: float):
+        self.first_name = first_name
+        self.received_at = received_at
+        self.started_at = time.monotonic()
+        self.fragments: list[str] = []
+        self.checks: list[asyncio.Task] = []
+        self.timer: asyncio.TimerHandle | None = None
+        self.helplines_sent = False
+
+    def cancel(self):
+        if self.timer is not None:
+            self.timer.cancel()
+        for check in self.checks:
+            check.cancel()
+
+
+class MessageCoalescer:
+    """
+    Buffers text messages per chat and queues each burst on the chat's
+    scheduler as respond(chat_id, text, first_name, received_at,
+    crisis_check, helplines_sent), where crisis_check is a coroutine
+    resolving to True if any fragment (or the combined text) is a crisis.
+    If a fragment is flagged before the burst is over, the burst is dropped
+    and `escalate(chat_id, first_name, received_at, helplines_sent)` is
+    called instead.
+
+    A fragment the local pre-screen flags calls `alert(chat_id)` straight
+    away (to send the helplines) but stays in the burst: only the LLM check
+    decides whether the burst is answered or escalated.
+
+    Each burst holds a scheduler slot from its first fragment, so buffered
+    bursts count against the scheduler's backlog like any other job.
+    """
+
+    def __init__(
+        self,
+        scheduler,
+        respond,
+        escalate,
+        alert,
+        quiet_ms: float = COALESCE_QUIET_MS,
+        max_wait_ms: float = COALESCE_MAX_WAIT_MS,
+        max_messages: int = COALESCE_MAX_MESSAGES,
+    ):
+        self.scheduler = scheduler
+        self.respond = respond
+        self.escalate = escalate
+        self.alert = alert
+        self.quiet = quiet_ms / 1000
+        self.max_wait = max_wait_ms / 1000
+        self.max_messages = max_messages
+
+        self._bursts: dict[object, Burst] = {}
+        self._dispatches: set[asyncio.Task] = set()
+        self.stats = {"fragments": 0, "bursts": 0, "coalesced": 0, "escalations": 0, "alerts": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.quiet > 0
+
+    def _dispatch(self, coro):
+        task = asyncio.create_task(coro)
+        self._dispatches.add(task)
+        task.add_done_callback(self._dispatches.discard)
+
+    async def add(self, chat_id, text: str, first_name: str, received_at: float, wait: bool = True) -> bool:
+        """
+        Buffer a text message, screening it for crisis language right away.
+        Starting a new burst needs a scheduler slot: when the backlog is full
+        this waits for one (or returns False if wait=False).
+        """
+        flagged = prescreen(text) == CRISIS
+        if flagged:
+            self.stats["alerts"] += 1
+            self._dispatch(self.alert(chat_id))
+
+        if chat_id not in self._bursts:
+            if not await self.scheduler.reserve(wait):
+                return False
+            if chat_id in self._bursts:
+                # Another fragment opened the burst while we waited for the slot
+                self.scheduler.release()
+            else:
+                self._bursts[chat_id] = Burst(first_name, received_at)
+
+        self.stats["fragments"] += 1
+        burst = self._bursts[chat_id]
+        burst.fragments.append(text)
+        burst.helplines_sent = burst.helplines_sent or flagged
+
+        check = asyncio.create_task(detect_crisis(text))
+        check.add_done_callback(lambda t: self._on_check(chat_id, burst, t))
+        burst.checks.append(check)
+
+        if len(burst.fragments) >= self.max_messages:
+            self.flush(chat_id)
+            return True
+
+        remaining = self.max_wait - (time.monotonic() - burst.started_at)
+        if burst.timer is not None:
+            burst.timer.cancel()
+        burst.timer = asyncio.get_running_loop().call_later(
+            max(0.0, min(self.quiet, remaining)), self.flush, chat_id
+        )
+        return True
+
+    def _on_check(self, chat_id, burst: Burst, check: asyncio.Task):
+        if check.cancelled() or check.exception() is not None or not check.result():
+            return
+        # Only escalate a burst that is still buffered; a flushed one is handled by its crisis_check
+        if self._bursts.get(chat_id) is burst:
+            self._escalate(chat_id, burst)
+
+    def _escalate(self, chat_id, burst: Burst):
+        self._bursts.pop(chat_id, None)
+        burst.cancel()
+        self.scheduler.release()
+        self.stats["escalations"] += 1
+        self._dispatch(self.escalate(chat_id, burst.first_name, burst.received_at, burst.helplines_sent))
+
+    def flush(self, chat_id):
+        """
+        Queue the buffered burst for a chat now (e.g. before a command). The
+        job is queued before this returns, so anything submitted after runs after it.
+        """
+        burst = self._bursts.pop(chat_id, None)
+        if burst is None:
+            return
+        if burst.timer is not None:
+            burst.timer.cancel()
+
+        self.stats["bursts"] += 1
+        self.stats["coalesced"] += len(burst.fragments) - 1
+        text = "\n".join(burst.fragments)
+
+        async def crisis_check() -> bool:
+            results = await asyncio.gather(*burst.checks, return_exceptions=True)
+            if any(result is True for result in results):
+                return True
+            if len(burst.fragments) > 1:
+                # Fragments can add up to something none of them says alone
+                return await detect_crisis(text)
+            return False
+
+        self.scheduler.enqueue(
+            chat_id, self.respond, chat_id, text, burst.first_name, burst.received_at, crisis_check(),
+            burst.helplines_sent,
+        )
+
+    async def stop(self):
+        """Drop buffered bursts and wait for in-progress escalations."""
+        for burst in self._bursts.values():
+            burst.cancel()
+            self.scheduler.release()
+        self._bursts.clear()
+        for task in list(self._dispatches):
+            task.cancel()
+        await asyncio.gather(*self._dispatches, return_exceptions=True)
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["buffered_chats"] = len(self._bursts)
+        return stats
@@ -0,0 +1,138 @@
+"""
+Pool of pre-fetched ElevenLabs Conversational AI signed URLs, so the /talk
+page doesn't wait for a get_signed_url round-trip on every click.
+"""
+import os
+import time
+import asyncio
+from collections import deque
+
+import httpx
+
+from services.elevenlabs import ELEVENLABS_BASE_URL
+
+ELEVENLABS_AGENT_ID = os.getenv("ELEVENLABS_AGENT_ID")
+
+# Signed URLs kept ready; each one is handed out once
+SIGNED_URL_POOL_SIZE = int(os.getenv("SIGNED_URL_POOL_SIZE", "5"))
+
+# ElevenLabs signed URLs expire 15 minutes after issue; stop handing them out a little earlier
+SIGNED_URL_TTL_SECONDS = float(os.getenv("SIGNED_URL_TTL_SECONDS", str(15 * 60)))
+SIGNED_URL_EXPIRY_MARGIN_SECONDS = float(os.getenv("SIGNED_URL_EXPIRY_MARGIN_SECONDS", "120"))
+
+# How often idle pools are topped up and expiring URLs replaced
+SIGNED_URL_REFRESH_SECONDS = float(os.getenv("SIGNED_URL_REFRESH_SECONDS", "60"))
+
+
+class SignedUrlError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class SignedUrlPool:
+    def __init__(
+        self,
+        agent_id: str | None = ELEVENLABS_AGENT_ID,
+        size: int = SIGNED_URL_POOL_SIZE,
+        max_age: float = SIGNED_URL_TTL_SECONDS - SIGNED_URL_EXPIRY_MARGIN_SECONDS,
+    ):
+        self.agent_id = agent_id
+        self.size = size
+        self.max_age = max_age
+
+        self._urls: deque[tuple[float, dict]] = deque()
+        self._refill_task: asyncio.Task | None = None
+        self._client: httpx.AsyncClient | None = None
+        self.stats = {"hits": 0, "misses": 0, "fetched": 0, "fetch_errors": 0, "expired": 0}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=30.0)
+        return self._client
+
+    async def _fetch(self) -> dict:
+        try:
+            response = await self._get_client().get(
+                f"{ELEVENLABS_BASE_URL}/v1/convai/conversation/get_signed_url",
+                params={"agent_id": self.agent_id},
+                headers={"xi-api-key": os.getenv("ELEVENLABS_API_KEY")},
+            )
+        except httpx.RequestError as e:
+            self.stats["fetch_errors"] += 1
+            raise SignedUrlError(500, f"Request failed: {str(e)}")
+
+        if response.status_code != 200:
+            self.stats["fetch_errors"] += 1
+            raise SignedUrlError(response.status_code, f"ElevenLabs API error: {response.text}")
+
+        self.stats["fetched"] += 1
+        return response.json()
+
+    def _drop_expiring(self):
+        cutoff = time.monotonic() - self.max_age
+        while self._urls and self._urls[0][0] < cutoff:
+            self._urls.popleft()
+            self.stats["expired"] += 1
+
+    async def _refill(self):
+        try:
+            missing = self.size - len(self._urls)
+            if missing <= 0:
+                return
+            results = await asyncio.gather(*(self._fetch() for _ in range(missing)), return_exceptions=True)
+            fetched_at = time.monotonic()
+            for result in results:
+                if not isinstance(result, Exception):
+                    self._urls.append((fetched_at, result))
+        finally:
+            self._refill_task = None
+
+    def refill(self) -> asyncio.Task | None:
+        """Top the pool up in the background (single-flight)."""
+        if not self.agent_id:
+            return None
+        self._drop_expiring()
+        if self._refill_task is None and len(self._urls) < self.size:
+            self._refill_task = asyncio.create_task(self._refill())
+        return self._refill_task
+
+    async def get(self) -> dict:
+        """A fresh signed URL payload, from the pool or (if it's empty) fetched directly."""
+        if not self.agent_id:
+            raise SignedUrlError(500, "ELEVENLABS_AGENT_ID not configured")
+
+        self._drop_expiring()
+        if self._urls:
+            _, payload = self._urls.popleft()
+            self.stats["hits"] += 1
+            self.refill()
+            return payload
+
+        self.stats["misses"] += 1
+        self.refill()
+        return await self._fetch()
+
+    async def run_refresh_loop(self):
+        """Keep the pool full and fresh even when nobody is clicking (run at startup)."""
+        while True:
+            task = self.refill()
+            if task is not None:
+                await asyncio.shield(task)
+            await asyncio.sleep(SIGNED_URL_REFRESH_SECONDS)
+
+    async def close(self):
+        if self._refill_task is not None:
+            self._refill_task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["ready"] = len(self._urls)
+        return stats
+
+
+signed_url_pool = SignedUrlPool()
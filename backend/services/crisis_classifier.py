@@ -0,0 +1,111 @@
+"""
+Local crisis pre-classifier that runs ahead of the LLM check.
+
+It only makes two kinds of decisions on its own:
+- CRISIS: the message clearly contains high-risk language, so helplines
+  can go out before any network call. The LLM check still runs and decides
+  whether the user gets the crisis flow or a normal reply.
+- BENIGN: the message is made up entirely of small talk ("thanks",
+  "good morning") with no risk terms, so the LLM call can be skipped.
+
+Everything else is UNCERTAIN and must still go to the LLM.
+"""
+import os
+import re
+
+CRISIS = "crisis"
+BENIGN = "benign"
+UNCERTAIN = "uncertain"
+
+CRISIS_PRESCREEN_ENABLED = os.getenv("CRISIS_PRESCREEN_ENABLED", "true").lower() == "true"
+
+# Score at or above which a message is escalated without asking the LLM
+CRISIS_PRESCREEN_THRESHOLD = float(os.getenv("CRISIS_PRESCREEN_THRESHOLD", "1.0"))
+
+# Longest message (in words) that can be classified as benign small talk
+CRISIS_PRESCREEN_BENIGN_MAX_WORDS = int(os.getenv("CRISIS_PRESCREEN_BENIGN_MAX_WORDS", "6"))
+
+# (weight, pattern) - explicit first-person intent scores a full 1.0 on its own,
+# weaker signals need to stack up before they escalate. Phrases that are just as
+# often idioms ("going to die of embarrassment", "no point going on with this
+# diet") stay below the threshold on their own.
+RISK_PATTERNS = [
+    (1.0, r"\bkill(ing)? my ?self\b"),
+    (1.0, r"\bend(ing)? (my (own )?life|it all)\b"),
+    (1.0, r"\btak(e|ing) my (own )?life\b"),
+    (1.0, r"\b(want|wanna|plan(ning)?|ready) to die\b"),
+    (0.5, r"\bgoing to die\b"),
+    (1.0, r"\bdon'?t want to (be alive|live|wake up)\b"),
+    (0.6, r"\bnever wake up\b"),
+    (1.0, r"\b(hang|hanging|shoot|shooting|drown|drowning) my ?self\b"),
+    (1.0, r"\b(cut|cutting|harm|harming) my ?self\b"),
+    (0.6, r"\b(hurt|hurting) my ?self\b"),
+    (1.0, r"\bsuicidal\b"),
+    (1.0, r"\bcommit(ting)? suicide\b"),
+    (1.0, r"\b(better off|be better) dead\b"),
+    (1.0, r"\bno (reason|point) (in |to )?(living|live)\b"),
+    (0.5, r"\bno (reason|point) (in |to )?going on\b"),
+    (1.0, r"\boverdos(e|ing) on purpose\b"),
+    (1.0, r"\bwrote (a|my) suicide (note|letter)\b"),
+    (0.5, r"\bwrote (a|my) goodbye (note|letter)\b"),
+    (0.6, r"\bsuicide\b"),
+    (0.6, r"\bself[- ]?harm(ing)?\b"),
+    (0.5, r"\bcan'?t (go on|take (it|this) any ?more|do this any ?more)\b"),
+    (0.5, r"\b(say(ing)?|said) goodbye\b"),
+    (0.5, r"\boverdos(e|ing)\b"),
+    (0.4, r"\bdisappear forever\b"),
+    (0.3, r"\b(hopeless|worthless|pointless)\b"),
+    (0.3, r"\bnobody would (care|miss me|notice)\b"),
+    (0.3, r"\b(pills|razor|rope|bridge)\b"),
+]
+
+_COMPILED_PATTERNS = [(weight, re.compile(pattern)) for weight, pattern in RISK_PATTERNS]
+
+# Words that can make up a benign message on their own. Farewells ("bye",
+# "good night") and bare negations ("no") are deliberately left out: a goodbye
+# with nothing else can be a warning sign, so those always go to the LLM.
+BENIGN_WORDS = frozenset("""
+hi hey hello hiya yo sup morning afternoon evening good gm
+thanks thank thx ty cheers appreciate appreciated it you so much very really a lot
+ok okay k kk alright cool nice great awesome perfect sounds lovely amazing
+yes yeah yep yup sure maybe
+lol haha hahaha hehe wow oh ah
+how are doing whats up
+i'm im am fine well
+""".split())
+
+_WORD = re.compile(r"[a-z']+")
+_NORMALIZE = str.maketrans({"’": "'", "‘": "'"})
+
+
+def risk_score(text: str) -> tuple[float, list[str]]:
+    """Sum of matched risk weights, plus the patterns that matched."""
+    lowered = text.lower().translate(_NORMALIZE)
+    score = 0.0
+    matches = []
+    for weight, pattern in _COMPILED_PATTERNS:
+        if pattern.search(lowered):
+            score += weight
+            matches.append(pattern.pattern)
+    return score, matches
+
+
+def is_small_talk(text: str) -> bool:
+    """True if every word in the message is from the benign vocabulary."""
+    words = _WORD.findall(text.lower().translate(_NORMALIZE))
+    if not words or len(words) > CRISIS_PRESCREEN_BENIGN_MAX_WORDS:
+        return False
+    return all(word.strip("'") in BENIGN_WORDS for word in words)
+
+
+def prescreen(text: str) -> str:
+    """Classify a message as CRISIS, BENIGN or UNCERTAIN without any network call."""
+    if not CRISIS_PRESCREEN_ENABLED:
+        return UNCERTAIN
+
+    score, _ = risk_score(text)
+    if score >= CRISIS_PRESCREEN_THRESHOLD:
+        return CRISIS
+    if score == 0 and is_small_talk(text):
+        return BENIGN
+    return UNCERTAIN
@@ -1,36 +1,186 @@
 import os
+import asyncio
+from typing import AsyncIterator
+
 import httpx
-from elevenlabs import ElevenLabs
 
-client = ElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY"))
+from services.tts_cache import tts_cache, cache_key
+from services.audio import concat_audio
+from services.metrics import instrument, AUDIO_BYTES
+from services.resilience import call_upstream
+
+ELEVENLABS_BASE_URL = os.getenv("ELEVENLABS_BASE_URL", "https://api.elevenlabs.io").rstrip("/")
+
+# Give up on a synthesis attempt (and retry it) after this long; the SDK default is 4 minutes
+ELEVENLABS_TIMEOUT_SECONDS = float(os.getenv("ELEVENLABS_TIMEOUT_SECONDS", "30"))
+
+_client = None
+
+
+def get_client():
+    """The ElevenLabs SDK client, created on first use (importing the SDK is slow)."""
+    global _client
+    if _client is None:
+        from elevenlabs import AsyncElevenLabs
+
+        _client = AsyncElevenLabs(
+            api_key=os.getenv("ELEVENLABS_API_KEY"),
+            base_url=ELEVENLABS_BASE_URL,
+            timeout=ELEVENLABS_TIMEOUT_SECONDS,
+        )
+    return _client
+
 
 # Use a calm, supportive voice
 DEFAULT_VOICE_ID = "21m00Tcm4TlvDq8ikWAM"  # Rachel voice
+DEFAULT_MODEL_ID = "eleven_multilingual_v2"
+
+# Telegram voice notes are meant to be Ogg/Opus; "mp3" keeps the old behaviour
+TTS_AUDIO_FORMAT = os.getenv("TTS_AUDIO_FORMAT", "opus").lower()
+TTS_OPUS_BITRATE = int(os.getenv("TTS_OPUS_BITRATE", "32"))  # kbps: 32, 64, 96, 128 or 192
+
+if TTS_AUDIO_FORMAT == "mp3":
+    OUTPUT_FORMAT = "mp3_44100_128"
+else:
+    OUTPUT_FORMAT = f"opus_48000_{TTS_OPUS_BITRATE}"
 
+# Max number of syntheses in flight at once (protects the account's concurrency quota)
+TTS_MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", "4"))
 
-def generate_voice_message(text: str, voice_id: str = None) -> bytes:
-    """Generate speech audio from text using ElevenLabs."""
-    audio_generator = client.text_to_speech.convert(
-        voice_id=voice_id or DEFAULT_VOICE_ID,
+_tts_semaphore = asyncio.Semaphore(TTS_MAX_CONCURRENCY)
+
+# Syntheses currently in flight, so concurrent identical requests share one call,
+# and how many callers are waiting on each
+_pending_syntheses: dict[str, asyncio.Task] = {}
+_synthesis_waiters: dict[asyncio.Task, int] = {}
+
+
+async def _convert(text: str, voice_id: str, model_id: str) -> bytes:
+    audio_stream = get_client().text_to_speech.convert(
+        voice_id=voice_id,
         text=text,
-        model_id="eleven_multilingual_v2",
+        model_id=model_id,
+        output_format=OUTPUT_FORMAT,
+        # Retries are handled by services.resilience so they share the circuit breaker
+        request_options={"max_retries": 0},
     )
 
-    # Collect all audio chunks into bytes
-    audio_bytes = b"".join(audio_generator)
+    # Collect all audio chunks into bytes without blocking the event loop
+    chunks = [chunk async for chunk in audio_stream]
+    return b"".join(chunks)
+
+
+async def _convert_limited(text: str, voice_id: str, model_id: str) -> bytes:
+    async with _tts_semaphore:
+        # The deadline starts once a slot is free, so queueing under load isn't a failure
+        return await asyncio.wait_for(_convert(text, voice_id, model_id), ELEVENLABS_TIMEOUT_SECONDS)
+
+
+@instrument("elevenlabs_synthesize")
+async def _synthesize(text: str, voice_id: str, model_id: str) -> bytes:
+    # Backoff between retries happens outside the semaphore, so it doesn't hold a slot
+    audio_bytes = await call_upstream("elevenlabs", lambda: _convert_limited(text, voice_id, model_id))
+    AUDIO_BYTES.observe("tts", value=len(audio_bytes))
     return audio_bytes
 
 
+@instrument("generate_voice_message")
+async def generate_voice_message(text: str, voice_id: str = None) -> bytes:
+    """Generate speech audio from text using ElevenLabs (cached by content)."""
+    voice_id = voice_id or DEFAULT_VOICE_ID
+    key = cache_key(voice_id, DEFAULT_MODEL_ID, text, OUTPUT_FORMAT)
+
+    audio_bytes = await tts_cache.get(key)
+    if audio_bytes is not None:
+        return audio_bytes
+
+    task = _pending_syntheses.get(key)
+    if task is None:
+        task = _pending_syntheses[key] = asyncio.create_task(_synthesize_and_cache(key, text, voice_id))
+        # Mark retrieved so a failure nobody is left waiting for isn't logged as never consumed
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    # The synthesis runs as its own task, so a cancelled caller doesn't cancel
+    # the others waiting on it; it's only cancelled once nobody is waiting
+    _synthesis_waiters[task] = _synthesis_waiters.get(task, 0) + 1
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        if _synthesis_waiters[task] == 1 and not task.done():
+            if _pending_syntheses.get(key) is task:
+                del _pending_syntheses[key]
+            task.cancel()
+        raise
+    finally:
+        _synthesis_waiters[task] -= 1
+        if not _synthesis_waiters[task]:
+            del _synthesis_waiters[task]
+
+
+async def _synthesize_and_cache(key: str, text: str, voice_id: str) -> bytes:
+    try:
+        audio_bytes = await _synthesize(text, voice_id, DEFAULT_MODEL_ID)
+        await tts_cache.put(key, audio_bytes)
+        return audio_bytes
+    finally:
+        if _pending_syntheses.get(key) is asyncio.current_task():
+            del _pending_syntheses[key]
+
+
+async def stream_voice_segments(
+    chunks: AsyncIterator[str],
+    voice_id: str = None,
+    gate: asyncio.Event | None = None,
+) -> AsyncIterator[bytes]:
+    """
+    Synthesize text chunks concurrently as they arrive and yield their audio
+    in order. If a gate is given, no synthesis starts until it is set.
+    """
+    tasks: list[asyncio.Task] = []
+    try:
+        async for chunk in chunks:
+            if gate is not None and not gate.is_set():
+                await gate.wait()
+            tasks.append(asyncio.create_task(generate_voice_message(chunk, voice_id=voice_id)))
+
+            # Hand over any segments that are already finished, in order
+            while tasks and tasks[0].done():
+                yield tasks.pop(0).result()
+
+        for task in tasks[:]:
+            yield await task
+            tasks.remove(task)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+@instrument("generate_voice_message_streamed")
+async def generate_voice_message_streamed(
+    chunks: AsyncIterator[str],
+    voice_id: str = None,
+    gate: asyncio.Event | None = None,
+) -> bytes:
+    """Synthesize streamed text chunk by chunk and stitch the audio into one voice note."""
+    segments = [segment async for segment in stream_voice_segments(chunks, voice_id, gate)]
+    # Ogg remuxing recomputes page CRCs in Python, so keep it off the event loop
+    audio_bytes = await asyncio.to_thread(concat_audio, segments)
+    AUDIO_BYTES.observe("tts_streamed", value=len(audio_bytes))
+    return audio_bytes
+
+
+@instrument("create_voice_clone")
 async def create_voice_clone(audio_bytes: bytes, name: str) -> str:
     """
     Create an instant voice clone from audio bytes.
     Returns the voice_id of the cloned voice.
     """
     api_key = os.getenv("ELEVENLABS_API_KEY")
+    AUDIO_BYTES.observe("clone_sample", value=len(audio_bytes))
 
     async with httpx.AsyncClient() as http_client:
         response = await http_client.post(
-            "https://api.elevenlabs.io/v1/voices/add",
+            f"{ELEVENLABS_BASE_URL}/v1/voices/add",
             headers={"xi-api-key": api_key},
             data={
                 "name": name,
@@ -47,3 +197,24 @@ async def create_voice_clone(audio_bytes: bytes, name: str) -> str:
 
         result = response.json()
         return result["voice_id"]
+
+
+@instrument("delete_voice")
+async def delete_voice(voice_id: str) -> bool:
+    """
+    Delete a cloned voice, freeing its slot on the account.
+    Returns False if it was already gone.
+    """
+    async with httpx.AsyncClient() as http_client:
+        response = await http_client.delete(
+            f"{ELEVENLABS_BASE_URL}/v1/voices/{voice_id}",
+            headers={"xi-api-key": os.getenv("ELEVENLABS_API_KEY")},
+            timeout=30.0,
+        )
+
+    if response.status_code in (400, 404):
+        # Already deleted (ElevenLabs reports unknown voices as either)
+        return False
+    if response.status_code != 200:
+        raise Exception(f"ElevenLabs API error: {response.status_code} - {response.text}")
+    return True
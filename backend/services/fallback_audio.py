@@ -0,0 +1,100 @@
+"""
+Pre-rendered voice notes served while ElevenLabs is unavailable, so users
+still get audio (rather than the plain-text apology) during an incident.
+"""
+import os
+import asyncio
+import hashlib
+
+from services.elevenlabs import generate_voice_message, OUTPUT_FORMAT
+from services.resilience import get_breaker
+
+AUDIO_LIBRARY_DIR = os.getenv(
+    "AUDIO_LIBRARY_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "audio_library")
+)
+
+FALLBACK_SCRIPTS = {
+    "reply": "Hey, I hear you. Whatever you're going through right now, know that you're not alone. Take a slow, deep breath with me. Cravings and hard moments pass, even when they feel like they won't. You've got this, and I believe in you.",
+    "crisis": "I hear you, and I'm really glad you reached out. What you're feeling right now is serious, and you deserve immediate support from someone who can truly help. Please reach out to one of the crisis helplines I've just sent you - they're available 24/7 and they care. You matter. Please make that call.",
+    "checkin": "Hey, it's your daily check-in from Kalm. I hope today treats you gently. Whatever it brings, remember that you're not alone and you don't have to get through it by yourself. If you need support at any point today, just send me a message. I'm here for you.",
+    "welcome": "Hey, welcome to Kalm. I'm so glad you're here. I'm your personal recovery companion, available 24/7 whenever you need support. Just send me a message anytime, and I'll respond with a voice note. You've already taken a brave step by being here. You're not alone in this journey.",
+}
+
+
+class FallbackAudioLibrary:
+    """Generic clips per kind, rendered once and kept on disk and in memory."""
+
+    def __init__(self, directory: str = AUDIO_LIBRARY_DIR):
+        self.directory = directory
+        self._clips: dict[str, bytes] = {}
+        self.stats = {"served": 0, "unavailable": 0}
+
+    def _path(self, kind: str) -> str:
+        # The script and format are part of the name, so edits re-render the clip
+        digest = hashlib.sha256(f"{OUTPUT_FORMAT}\0{FALLBACK_SCRIPTS[kind]}".encode()).hexdigest()[:12]
+        extension = "mp3" if OUTPUT_FORMAT.startswith("mp3") else "ogg"
+        return os.path.join(self.directory, f"{kind}-{digest}.{extension}")
+
+    def _read(self, path: str) -> bytes | None:
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, path: str, audio_bytes: bytes):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio_bytes)
+        os.replace(tmp_path, path)
+
+    async def warm(self, render: bool = True):
+        """Load the library from disk, rendering any missing clips unless render=False (run at startup)."""
+        for kind, script in FALLBACK_SCRIPTS.items():
+            if kind in self._clips:
+                continue
+            path = self._path(kind)
+            try:
+                audio_bytes = await asyncio.to_thread(self._read, path)
+                if audio_bytes is None:
+                    if not render:
+                        continue
+                    audio_bytes = await generate_voice_message(script)
+                    await asyncio.to_thread(self._write, path, audio_bytes)
+                    print(f"🎧 Rendered fallback clip: {kind}")
+                self._clips[kind] = audio_bytes
+            except Exception as e:
+                print(f"Fallback clip error for {kind}: {e}")
+
+    def get(self, kind: str) -> bytes | None:
+        return self._clips.get(kind)
+
+    async def with_fallback(self, kind: str, audio):
+        """
+        Await the `audio` coroutine, or serve the pre-rendered clip instead
+        while the ElevenLabs circuit is open or if synthesis fails.
+        """
+        clip = self._clips.get(kind)
+        if clip is not None and get_breaker("elevenlabs").is_open:
+            audio.close()
+            self.stats["served"] += 1
+            return clip
+
+        try:
+            return await audio
+        except Exception as e:
+            if clip is None:
+                self.stats["unavailable"] += 1
+                raise
+            print(f"Voice generation failed ({e}), sending pre-rendered {kind} clip")
+            self.stats["served"] += 1
+            return clip
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["clips"] = len(self._clips)
+        return stats
+
+
+fallback_library = FallbackAudioLibrary()
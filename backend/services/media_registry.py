@@ -0,0 +1,154 @@
+import json
+import os
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+
+MEDIA_REGISTRY_FILE = os.getenv(
+    "MEDIA_REGISTRY_FILE", os.path.join(os.path.dirname(__file__), "..", "media_ids.jsonl")
+)
+MEDIA_REGISTRY_MAX_ENTRIES = int(os.getenv("MEDIA_REGISTRY_MAX_ENTRIES", "10000"))
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 of the raw media bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class MediaRegistry:
+    """
+    Maps audio content hashes to Telegram file_ids, evicting the least
+    recently used. Persisted as an append-only JSON-lines log that is
+    compacted (in recency order) when it grows well past the number of live
+    entries; file I/O runs in a thread, off the event loop.
+    """
+
+    def __init__(self, path: str = MEDIA_REGISTRY_FILE, max_entries: int = MEDIA_REGISTRY_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, str] | None = None
+        self._log_lines = 0
+        # Log line each entry was last written at, to re-log reused ones before
+        # they age out of what a reload would keep
+        self._logged_at: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _load(self) -> OrderedDict:
+        if self._entries is not None:
+            return self._entries
+
+        entries = OrderedDict()
+        logged_at = {}
+        lines = 0
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue  # Torn write from a crash
+                        lines += 1
+                        digest = record.get("hash")
+                        file_id = record.get("file_id")
+                        entries.pop(digest, None)
+                        if file_id:
+                            entries[digest] = file_id
+                            logged_at[digest] = lines
+            except OSError as e:
+                print(f"Media registry load error: {e}")
+
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+        self._entries = entries
+        self._log_lines = lines
+        self._logged_at = {digest: logged_at.get(digest, 0) for digest in entries}
+        return entries
+
+    def _append(self, digest: str, file_id: str | None):
+        try:
+            with open(self.path, "a") as f:
+                f.write(json.dumps({"hash": digest, "file_id": file_id}) + "\n")
+            self._log_lines += 1
+            if file_id:
+                self._logged_at[digest] = self._log_lines
+            else:
+                self._logged_at.pop(digest, None)
+            if self._log_lines > 2 * self.max_entries:
+                self._compact()
+        except OSError as e:
+            print(f"Media registry save error: {e}")
+
+    def _compact(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            for digest, file_id in self._entries.items():
+                f.write(json.dumps({"hash": digest, "file_id": file_id}) + "\n")
+        os.replace(tmp_path, self.path)
+        self._log_lines = len(self._entries)
+        self._logged_at = {digest: line for line, digest in enumerate(self._entries, start=1)}
+
+    def _load_locked(self):
+        with self._lock:
+            self._load()
+
+    def _put(self, digest: str, file_id: str):
+        with self._lock:
+            entries = self._load()
+            if entries.get(digest) == file_id:
+                entries.move_to_end(digest)
+                return
+            entries[digest] = file_id
+            entries.move_to_end(digest)
+            while len(entries) > self.max_entries:
+                evicted, _ = entries.popitem(last=False)
+                self._logged_at.pop(evicted, None)
+            self._append(digest, file_id)
+
+    def _relog(self, digest: str):
+        with self._lock:
+            file_id = self._entries.get(digest)
+            if file_id is not None:
+                self._append(digest, file_id)
+
+    def _needs_relog(self, digest: str) -> bool:
+        # A reload keeps (at most) the last max_entries log lines' worth of entries
+        return self._log_lines - self._logged_at.get(digest, 0) > self.max_entries // 2
+
+    def _forget(self, digest: str):
+        with self._lock:
+            if self._load().pop(digest, None) is not None:
+                self._append(digest, None)
+
+    async def get(self, digest: str) -> str | None:
+        """Return the Telegram file_id for a content hash, if known."""
+        if self._entries is None:
+            await asyncio.to_thread(self._load_locked)
+        with self._lock:
+            file_id = self._entries.get(digest)
+            if file_id is None:
+                return None
+            # Keep reused clips (crisis, welcomes, check-ins) clear of eviction
+            self._entries.move_to_end(digest)
+            relog = self._needs_relog(digest)
+        if relog:
+            await asyncio.to_thread(self._relog, digest)
+        return file_id
+
+    async def put(self, digest: str, file_id: str):
+        """Remember the file_id Telegram assigned to this content."""
+        await asyncio.to_thread(self._put, digest, file_id)
+
+    async def forget(self, digest: str):
+        """Drop a file_id Telegram no longer accepts."""
+        await asyncio.to_thread(self._forget, digest)
+
+    def __len__(self) -> int:
+        # Never loads the log here: this is read by the metrics endpoint on the event loop
+        with self._lock:
+            return len(self._entries) if self._entries is not None else 0
+
+
+media_registry = MediaRegistry()
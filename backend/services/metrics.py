@@ -0,0 +1,191 @@
+"""
+Minimal Prometheus-style metrics (counters, gauges, histograms) rendered in
+the text exposition format on /metrics.
+"""
+import time
+import functools
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 131072, 262144, 524288, 1048576, 2097152, 4194304)
+
+_metrics = []
+_collectors = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        _metrics.append(self)
+
+    def inc(self, *label_values, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, total in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, values)} {_format_value(total)}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        _metrics.append(self)
+
+    def set(self, *label_values, value: float):
+        self._values[label_values] = value
+
+    def inc(self, *label_values, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for values, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, values)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: dict[tuple, list] = {}
+        _metrics.append(self)
+
+    def observe(self, *label_values, value: float):
+        series = self._values.get(label_values)
+        if series is None:
+            series = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, series in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labels, values, le)} {cumulative}"
+                )
+            labels = _format_labels(self.labels, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+# Service-level instrumentation shared by everything in services/
+
+STAGE_LATENCY = Histogram(
+    "kalm_stage_duration_seconds", "Latency of each service call.", ("stage",)
+)
+STAGE_ERRORS = Counter(
+    "kalm_stage_errors_total", "Failed service calls (raised or handled with a fallback).", ("stage",)
+)
+STAGE_IN_FLIGHT = Gauge(
+    "kalm_stage_in_flight", "Service calls currently running.", ("stage",)
+)
+AUDIO_BYTES = Histogram(
+    "kalm_audio_bytes", "Size of audio payloads.", ("kind",), buckets=BYTES_BUCKETS
+)
+TOKENS = Counter(
+    "kalm_openai_tokens_total", "OpenAI token usage.", ("stage", "type")
+)
+TIME_TO_VOICE_NOTE = Histogram(
+    "kalm_time_to_voice_note_seconds", "From receiving a message to its voice note being sent.", ("flow",)
+)
+
+
+def instrument(stage: str):
+    """Record latency, errors and in-flight count for an async service function."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            STAGE_IN_FLIGHT.inc(stage)
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                STAGE_ERRORS.inc(stage)
+                raise
+            finally:
+                STAGE_LATENCY.observe(stage, value=time.perf_counter() - start)
+                STAGE_IN_FLIGHT.dec(stage)
+
+        return wrapper
+
+    return decorator
+
+
+def count_error(stage: str):
+    """Count a failure that was handled inside the service (e.g. with a fallback)."""
+    STAGE_ERRORS.inc(stage)
+
+
+def record_tokens(stage: str, usage):
+    """Add an OpenAI response's token usage to the counters."""
+    if usage is None:
+        return
+    TOKENS.inc(stage, "prompt", amount=getattr(usage, "prompt_tokens", 0) or 0)
+    TOKENS.inc(stage, "completion", amount=getattr(usage, "completion_tokens", 0) or 0)
+
+
+def register_collector(prefix: str, get_stats):
+    """Expose a component's stats dict as gauges named kalm_<prefix>_<key>."""
+    _collectors.append((prefix, get_stats))
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+
+    for prefix, get_stats in _collectors:
+        try:
+            stats = get_stats()
+        except Exception as e:
+            print(f"Metrics collector {prefix} error: {e}")
+            continue
+        for key, value in stats.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"kalm_{prefix}_{key}"
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_format_value(value)}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,222 @@
+"""
+Retries with jitter, hedged requests and per-upstream circuit breakers
+shared by the OpenAI and ElevenLabs services.
+"""
+import os
+import time
+import random
+import asyncio
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RECOVERY_SECONDS = float(os.getenv("CIRCUIT_RECOVERY_SECONDS", "30"))
+
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.25"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "2.0"))
+
+# Statuses worth retrying (the same set the OpenAI SDK retries by default);
+# any other 4xx is the request's fault and fails straight away
+RETRYABLE_STATUSES = frozenset({408, 409, 429})
+
+# Transport-level errors from the SDKs (matched by name so neither SDK has to
+# be imported here): openai.APIConnectionError / APITimeoutError and httpx's
+# TransportError family, which the ElevenLabs SDK lets through
+RETRYABLE_ERROR_NAMES = frozenset({"APIConnectionError", "APITimeoutError", "TransportError", "TimeoutException"})
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the upstream while its circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures, rejects calls for
+    `recovery_seconds`, then lets a single trial call through (half-open).
+    A trial that never reports back (e.g. cancelled) expires after another
+    `recovery_seconds`, so the breaker can't get stuck half-open.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        recovery_seconds: float = CIRCUIT_RECOVERY_SECONDS,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._trial_started_at = 0.0
+        self.stats = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    def allow(self) -> bool:
+        """Whether a call may go to the upstream right now."""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.recovery_seconds:
+            self.state = HALF_OPEN
+            self._trial_in_flight = False
+        if self.state == HALF_OPEN and (
+            not self._trial_in_flight or time.monotonic() - self._trial_started_at >= self.recovery_seconds
+        ):
+            self._trial_in_flight = True
+            self._trial_started_at = time.monotonic()
+            return True
+        self.stats["rejected"] += 1
+        return False
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == OPEN and time.monotonic() - self.opened_at < self.recovery_seconds
+
+    def release_trial(self):
+        """The call allowed through finished without a verdict (cancelled); let another try."""
+        self._trial_in_flight = False
+
+    def record_success(self):
+        self.stats["successes"] += 1
+        self.failures = 0
+        self.state = CLOSED
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.stats["failures"] += 1
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.stats["opened"] += 1
+                print(f"⚡ Circuit for {self.name} opened after {self.failures} failures")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["open"] = 1 if self.is_open else 0
+        stats["consecutive_failures"] = self.failures
+        return stats
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(upstream: str) -> CircuitBreaker:
+    breaker = _breakers.get(upstream)
+    if breaker is None:
+        breaker = _breakers[upstream] = CircuitBreaker(upstream)
+    return breaker
+
+
+def backoff_delay(attempt: int, base: float = RETRY_BASE_DELAY, cap: float = RETRY_MAX_DELAY) -> float:
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def _status_code(error: Exception) -> int | None:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(error: Exception) -> bool:
+    """Timeouts, connection errors, 408/409/429 and 5xx; not bad requests, auth errors or 404s."""
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    if any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__):
+        return True
+    status = _status_code(error)
+    return status is not None and (status in RETRYABLE_STATUSES or status >= 500)
+
+
+async def _hedged(func, hedge_after: float):
+    """Start func(); if it hasn't finished after hedge_after seconds, race a second copy."""
+    first = asyncio.create_task(func())
+    try:
+        done, _ = await asyncio.wait({first}, timeout=hedge_after)
+    except asyncio.CancelledError:
+        first.cancel()
+        raise
+    if done:
+        return first.result()
+
+    second = asyncio.create_task(func())
+    pending = {first, second}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def call_upstream(
+    upstream: str,
+    func,
+    attempts: int = RETRY_ATTEMPTS,
+    hedge_after: float | None = None,
+    timeout: float | None = None,
+):
+    """
+    Call func() (a zero-argument coroutine factory) through the upstream's
+    circuit breaker, retrying failures with jittered backoff and optionally
+    hedging each attempt after `hedge_after` seconds. An attempt (hedge
+    included) still running after `timeout` seconds is abandoned and counts
+    as a retryable failure. Errors that aren't `is_retryable` are raised at
+    once and don't count against the breaker.
+    """
+    breaker = get_breaker(upstream)
+    last_error = None
+
+    for attempt in range(max(1, attempts)):
+        if not breaker.allow():
+            raise CircuitOpenError(f"{upstream} circuit is open") from last_error
+
+        try:
+            if hedge_after is not None:
+                attempt_call = _hedged(func, hedge_after)
+            else:
+                attempt_call = func()
+            if timeout:
+                result = await asyncio.wait_for(attempt_call, timeout)
+            else:
+                result = await attempt_call
+        except asyncio.CancelledError:
+            breaker.release_trial()
+            raise
+        except Exception as e:
+            if not is_retryable(e):
+                breaker.release_trial()
+                raise
+            last_error = e
+            breaker.record_failure()
+            if attempt + 1 < attempts:
+                await asyncio.sleep(backoff_delay(attempt))
+            continue
+
+        breaker.record_success()
+        return result
+
+    raise last_error
+
+
+def get_circuit_stats() -> dict:
+    """Flattened breaker stats for the metrics collector."""
+    stats = {}
+    for name, breaker in _breakers.items():
+        for key, value in breaker.get_stats().items():
+            stats[f"{name}_{key}"] = value
+    return stats
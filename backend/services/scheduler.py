@@ -0,0 +1,132 @@
+import os
+import time
+import asyncio
+from collections import deque
+
+# Max jobs running at once across all chats
+SCHEDULER_MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "16"))
+
+# Max jobs queued or running before submitters have to wait (or are rejected)
+SCHEDULER_MAX_PENDING = int(os.getenv("SCHEDULER_MAX_PENDING", "1000"))
+
+
+class ChatScheduler:
+    """
+    Runs jobs FIFO per chat (serial within a chat, parallel across chats)
+    under a global concurrency limit, with a bounded backlog for backpressure.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = SCHEDULER_MAX_CONCURRENCY,
+        max_pending: int = SCHEDULER_MAX_PENDING,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+
+        self._queues: dict[object, deque] = {}
+        self._workers: dict[object, asyncio.Task] = {}
+        self._running = asyncio.Semaphore(max_concurrency)
+        self._slots = asyncio.Semaphore(max_pending)
+        self._pending = 0
+        self._in_flight = 0
+
+        self._waits = deque(maxlen=1000)
+        self.stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "max_wait_seconds": 0.0,
+        }
+
+    async def reserve(self, wait: bool = True) -> bool:
+        """
+        Take a backlog slot for a job that will be enqueue()d later.
+        When the backlog is full, waits for space (or returns False if wait=False).
+        """
+        if not wait and self._slots.locked():
+            self.stats["rejected"] += 1
+            return False
+
+        await self._slots.acquire()
+        self._pending += 1
+        return True
+
+    def release(self):
+        """Give back a reserved slot that won't be used."""
+        self._pending -= 1
+        self._slots.release()
+
+    def enqueue(self, chat_id, func, *args):
+        """Queue func(*args) behind any earlier jobs for the same chat, on a reserved slot."""
+        self.stats["submitted"] += 1
+
+        queue = self._queues.setdefault(chat_id, deque())
+        queue.append((func, args, time.monotonic()))
+
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._drain(chat_id))
+
+    async def submit(self, chat_id, func, *args, wait: bool = True) -> bool:
+        """
+        Queue func(*args) behind any earlier jobs for the same chat.
+        When the backlog is full, waits for space (or returns False if wait=False).
+        """
+        if not await self.reserve(wait):
+            return False
+        self.enqueue(chat_id, func, *args)
+        return True
+
+    async def _drain(self, chat_id):
+        queue = self._queues[chat_id]
+        try:
+            while queue:
+                func, args, enqueued_at = queue.popleft()
+                try:
+                    async with self._running:
+                        waited = time.monotonic() - enqueued_at
+                        self._waits.append(waited)
+                        self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], waited)
+
+                        self._in_flight += 1
+                        try:
+                            await func(*args)
+                            self.stats["completed"] += 1
+                        except Exception as e:
+                            self.stats["failed"] += 1
+                            print(f"Scheduled job error for chat {chat_id}: {e}")
+                        finally:
+                            self._in_flight -= 1
+                finally:
+                    self.release()
+        finally:
+            self._workers.pop(chat_id, None)
+            if not queue:
+                self._queues.pop(chat_id, None)
+
+    async def stop(self):
+        """Cancel all queued and running jobs."""
+        workers = list(self._workers.values())
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for queue in self._queues.values():
+            for _ in queue:
+                self.release()
+        self._queues.clear()
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        waits = sorted(self._waits)
+        stats["queue_depth"] = self._pending - self._in_flight
+        stats["in_flight"] = self._in_flight
+        stats["active_chats"] = len(self._workers)
+        stats["max_concurrency"] = self.max_concurrency
+        stats["max_pending"] = self.max_pending
+        stats["wait_p50_seconds"] = round(waits[len(waits) // 2], 4) if waits else 0.0
+        stats["wait_p95_seconds"] = round(waits[int(len(waits) * 0.95)], 4) if waits else 0.0
+        return stats
+
+
+scheduler = ChatScheduler()
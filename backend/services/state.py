@@ -0,0 +1,285 @@
+"""
+Shared state for running several workers or replicas: short-lived keys with
+TTLs (clone-await flags, seen update_ids, the polling offset) and the
+poller leadership lock.
+
+Every backend implements the same small, Redis-compatible subset of
+commands (GET, SET with EX/NX, DELETE, plus compare-and-set renew/release
+for locks), so a Redis, Valkey or KeyDB server can be dropped in for
+multi-node deployments.
+"""
+import os
+import time
+import uuid
+import socket
+import asyncio
+import sqlite3
+import threading
+
+# "sqlite" (default, shared by the workers of one node), "memory" (single process) or "redis"
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite").lower()
+STATE_DB = os.getenv("STATE_DB", os.path.join(os.path.dirname(__file__), "..", "state.db"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+STATE_KEY_PREFIX = os.getenv("STATE_KEY_PREFIX", "kalm:")
+
+# Expired SQLite rows are purged every this many writes
+_PURGE_EVERY = 500
+
+# Compare-and-set for Redis: only touch the key while it still holds our value
+_RENEW_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("PEXPIRE", KEYS[1], ARGV[2])
+end
+return 0
+"""
+_DELETE_IF_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+class MemoryStateStore:
+    """Process-local store; fine for a single worker and for local development."""
+
+    def __init__(self):
+        self._data: dict[str, tuple[str, float | None]] = {}
+        self._writes = 0
+
+    def _live(self, key: str) -> str | None:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[key]
+            return None
+        return value
+
+    async def get(self, key: str) -> str | None:
+        return self._live(key)
+
+    async def set(self, key: str, value: str, ex: float | None = None, nx: bool = False) -> bool:
+        if nx and self._live(key) is not None:
+            return False
+        self._data[key] = (value, time.time() + ex if ex else None)
+
+        self._writes += 1
+        if self._writes % _PURGE_EVERY == 0:
+            for stale in [k for k in self._data if self._live(k) is None]:
+                self._data.pop(stale, None)
+        return True
+
+    async def delete(self, key: str) -> int:
+        return 0 if self._data.pop(key, None) is None else 1
+
+    async def renew(self, key: str, value: str, ex: float) -> bool:
+        if self._live(key) != value:
+            return False
+        self._data[key] = (value, time.time() + ex)
+        return True
+
+    async def delete_if(self, key: str, value: str) -> bool:
+        if self._live(key) != value:
+            return False
+        del self._data[key]
+        return True
+
+    def get_stats(self) -> dict:
+        return {"keys": len(self._data)}
+
+
+class SQLiteStateStore:
+    """Store in a WAL-mode SQLite file, shared by every worker on the host."""
+
+    def __init__(self, path: str = STATE_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS kv (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL
+            )"""
+        )
+
+    def _get(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key: str, value: str, ex: float | None, nx: bool) -> bool:
+        now = time.time()
+        expires_at = now + ex if ex else None
+        with self._lock:
+            if nx:
+                # Insert, or take over the key only if it has expired (atomic across processes)
+                cursor = self._conn.execute(
+                    """INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at
+                    WHERE kv.expires_at IS NOT NULL AND kv.expires_at <= ?""",
+                    (key, value, expires_at, now),
+                )
+                stored = cursor.rowcount > 0
+            else:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at),
+                )
+                stored = True
+
+            self._writes += 1
+            if self._writes % _PURGE_EVERY == 0:
+                self._conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        return stored
+
+    def _delete(self, key: str) -> int:
+        with self._lock:
+            return self._conn.execute("DELETE FROM kv WHERE key = ?", (key,)).rowcount
+
+    def _renew(self, key: str, value: str, ex: float) -> bool:
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                """UPDATE kv SET expires_at = ?
+                WHERE key = ? AND value = ? AND (expires_at IS NULL OR expires_at > ?)""",
+                (now + ex, key, value, now),
+            )
+        return cursor.rowcount > 0
+
+    def _delete_if(self, key: str, value: str) -> bool:
+        with self._lock:
+            return self._conn.execute("DELETE FROM kv WHERE key = ? AND value = ?", (key, value)).rowcount > 0
+
+    # Queries run in a thread: with several workers on one file a write can
+    # wait up to busy_timeout for the lock, which mustn't stall the event loop
+
+    async def get(self, key: str) -> str | None:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: str, ex: float | None = None, nx: bool = False) -> bool:
+        return await asyncio.to_thread(self._set, key, value, ex, nx)
+
+    async def delete(self, key: str) -> int:
+        return await asyncio.to_thread(self._delete, key)
+
+    async def renew(self, key: str, value: str, ex: float) -> bool:
+        return await asyncio.to_thread(self._renew, key, value, ex)
+
+    async def delete_if(self, key: str, value: str) -> bool:
+        return await asyncio.to_thread(self._delete_if, key, value)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {"keys": self._conn.execute("SELECT COUNT(*) FROM kv").fetchone()[0]}
+
+
+class RedisStateStore:
+    """Store on a Redis-compatible server, shared by every node."""
+
+    def __init__(self, url: str = REDIS_URL):
+        # Imported here so deployments without Redis don't pay for it at startup
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError:
+            raise Exception("STATE_BACKEND=redis requires the 'redis' package")
+        self._redis = redis_asyncio.from_url(url, decode_responses=True)
+
+    async def get(self, key: str) -> str | None:
+        return await self._redis.get(key)
+
+    async def set(self, key: str, value: str, ex: float | None = None, nx: bool = False) -> bool:
+        px = int(ex * 1000) if ex else None
+        return bool(await self._redis.set(key, value, px=px, nx=nx))
+
+    async def delete(self, key: str) -> int:
+        return await self._redis.delete(key)
+
+    async def renew(self, key: str, value: str, ex: float) -> bool:
+        return bool(await self._redis.eval(_RENEW_SCRIPT, 1, key, value, int(ex * 1000)))
+
+    async def delete_if(self, key: str, value: str) -> bool:
+        return bool(await self._redis.eval(_DELETE_IF_SCRIPT, 1, key, value))
+
+    def get_stats(self) -> dict:
+        return {}
+
+
+class PrefixedStateStore:
+    """Namespaces every key, so several bots can share one server."""
+
+    def __init__(self, store, prefix: str = STATE_KEY_PREFIX):
+        self.store = store
+        self.prefix = prefix
+
+    async def get(self, key: str) -> str | None:
+        return await self.store.get(self.prefix + key)
+
+    async def set(self, key: str, value: str, ex: float | None = None, nx: bool = False) -> bool:
+        return await self.store.set(self.prefix + key, value, ex=ex, nx=nx)
+
+    async def delete(self, key: str) -> int:
+        return await self.store.delete(self.prefix + key)
+
+    async def renew(self, key: str, value: str, ex: float) -> bool:
+        return await self.store.renew(self.prefix + key, value, ex)
+
+    async def delete_if(self, key: str, value: str) -> bool:
+        return await self.store.delete_if(self.prefix + key, value)
+
+    def get_stats(self) -> dict:
+        return self.store.get_stats()
+
+
+class LeaderLock:
+    """
+    A TTL lock that at most one process holds at a time. The holder must
+    call acquire() again (which renews it) well within the TTL.
+    """
+
+    def __init__(self, store, name: str, ttl: float):
+        self.store = store
+        self.key = f"lock:{name}"
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    async def acquire(self) -> bool:
+        """Take the lock if it's free, or renew it if we already hold it."""
+        if await self.store.set(self.key, self.owner, ex=self.ttl, nx=True):
+            return True
+        # Renew only while the key is still ours, so a lock that expired and
+        # was taken over in the meantime isn't overwritten
+        return await self.store.renew(self.key, self.owner, self.ttl)
+
+    async def release(self):
+        await self.store.delete_if(self.key, self.owner)
+
+
+_state = None
+_state_lock = threading.Lock()
+
+
+def get_state():
+    """Return the configured state store, creating it on first use."""
+    global _state
+    if _state is None:
+        with _state_lock:
+            if _state is None:
+                if STATE_BACKEND == "memory":
+                    store = MemoryStateStore()
+                elif STATE_BACKEND == "redis":
+                    store = RedisStateStore()
+                else:
+                    store = SQLiteStateStore()
+                _state = PrefixedStateStore(store)
+    return _state
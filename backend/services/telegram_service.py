@@ -1,123 +1,412 @@
 import os
+import time
+import asyncio
 import httpx
 
+from services.media_registry import media_registry, content_hash
+from services.metrics import instrument, AUDIO_BYTES
+from services.audio import is_ogg, ogg_opus_duration
+
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org").rstrip("/")
 
+# Connection pool settings for the shared Bot API client
+TELEGRAM_HTTP2 = os.getenv("TELEGRAM_HTTP2", "true").lower() == "true"
+TELEGRAM_MAX_CONNECTIONS = int(os.getenv("TELEGRAM_MAX_CONNECTIONS", "100"))
+TELEGRAM_MAX_KEEPALIVE = int(os.getenv("TELEGRAM_MAX_KEEPALIVE", "20"))
+TELEGRAM_KEEPALIVE_EXPIRY = float(os.getenv("TELEGRAM_KEEPALIVE_EXPIRY", "60"))
 
-def get_api_url():
-    return f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
+# Per-endpoint timeouts (seconds)
+TIMEOUTS = {
+    "sendVoice": 60.0,
+    "sendMessage": 30.0,
+    "sendChatAction": 10.0,
+    "setWebhook": 30.0,
+    "deleteWebhook": 30.0,
+    "getFile": 30.0,
+    "download": 60.0,
+}
 
+# Outbound message rate limits (Telegram allows ~30 msg/s overall, ~1 msg/s per chat)
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_GLOBAL_BURST = float(os.getenv("TELEGRAM_GLOBAL_BURST", "30"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", "3"))
 
-async def send_voice_message(chat_id: str, audio_bytes: bytes, caption: str = None) -> dict:
-    """Send a voice message via Telegram Bot API."""
-    async with httpx.AsyncClient() as client:
-        files = {"voice": ("message.mp3", audio_bytes, "audio/mpeg")}
-        data = {"chat_id": chat_id}
+# How often (and how long) to wait out a 429 before giving up on a message
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+TELEGRAM_MAX_RETRY_AFTER = float(os.getenv("TELEGRAM_MAX_RETRY_AFTER", "60"))
+
+# Per-chat buckets kept before idle ones are pruned
+MAX_CHAT_BUCKETS = 10000
+
+# 400 descriptions that mean a cached file_id can't be used and must be re-uploaded
+FILE_ID_ERRORS = (
+    "wrong file identifier",
+    "wrong remote file identifier",
+    "file reference",
+    "type of file mismatch",
+    "wrong type of the web page content",
+    "failed to get http url content",
+)
+
+# One long-lived client per process, opened and closed by the app lifespan
+_client: httpx.AsyncClient | None = None
+
+_stats = {
+    "requests": 0,
+    "errors": 0,
+    "in_flight": 0,
+    "clients_created": 0,
+    "voice_uploads": 0,
+    "voice_reused": 0,
+}
+
+
+_rate_stats = {
+    "throttled": 0,
+    "throttle_wait_seconds": 0.0,
+    "rate_limited_429": 0,
+    "retries": 0,
+    "gave_up": 0,
+}
+
+
+class TokenBucket:
+    """
+    Token bucket that hands out reservations: callers take a token now and
+    are told how long to wait for it, so waiters are served in order.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Take one token and return the seconds to wait before using it."""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    def block(self, seconds: float):
+        """Hold all reservations back for a server-imposed retry_after."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
 
-        if caption:
-            data["caption"] = caption
+    def is_idle(self) -> bool:
+        now = time.monotonic()
+        self._refill(now)
+        return self.tokens >= self.capacity and self.blocked_until <= now
 
-        response = await client.post(
-            f"{get_api_url()}/sendVoice",
-            files=files,
-            data=data,
-            timeout=60.0
-        )
 
+_global_bucket = TokenBucket(TELEGRAM_GLOBAL_RATE, TELEGRAM_GLOBAL_BURST)
+_chat_buckets: dict[str, TokenBucket] = {}
+
+
+def _chat_bucket(chat_id) -> TokenBucket:
+    key = str(chat_id)
+    bucket = _chat_buckets.get(key)
+    if bucket is None:
+        if len(_chat_buckets) >= MAX_CHAT_BUCKETS:
+            for idle_key in [k for k, b in _chat_buckets.items() if b.is_idle()]:
+                del _chat_buckets[idle_key]
+        bucket = _chat_buckets[key] = TokenBucket(TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST)
+    return bucket
+
+
+async def _throttle(chat_id):
+    """Wait until both the global and the per-chat bucket allow a send."""
+    wait = max(_global_bucket.reserve(), _chat_bucket(chat_id).reserve())
+    if wait > 0:
+        _rate_stats["throttled"] += 1
+        _rate_stats["throttle_wait_seconds"] += wait
+        await asyncio.sleep(wait)
+
+
+async def _send(endpoint: str, chat_id, **kwargs) -> dict:
+    """
+    Rate-limited Bot API send. A 429 is retried after Telegram's retry_after
+    (up to TELEGRAM_MAX_RETRIES); the last response is returned either way.
+    """
+    attempt = 0
+    while True:
+        await _throttle(chat_id)
+        response = await _request("POST", f"{get_api_url()}/{endpoint}", endpoint, **kwargs)
         result = response.json()
 
-        if not result.get("ok"):
+        if response.status_code != 429 and result.get("error_code") != 429:
+            return result
+
+        _rate_stats["rate_limited_429"] += 1
+        retry_after = float((result.get("parameters") or {}).get("retry_after", 1))
+        _chat_bucket(chat_id).block(retry_after)
+
+        if attempt >= TELEGRAM_MAX_RETRIES or retry_after > TELEGRAM_MAX_RETRY_AFTER:
+            _rate_stats["gave_up"] += 1
+            return result
+
+        attempt += 1
+        _rate_stats["retries"] += 1
+        print(f"⏳ Telegram 429 for chat {chat_id}, retrying in {retry_after}s")
+
+
+def get_rate_limit_stats() -> dict:
+    """Throttling and 429 counters for outbound messages."""
+    stats = dict(_rate_stats)
+    stats["throttle_wait_seconds"] = round(stats["throttle_wait_seconds"], 3)
+    stats["chat_buckets"] = len(_chat_buckets)
+    stats["global_rate"] = TELEGRAM_GLOBAL_RATE
+    stats["chat_rate"] = TELEGRAM_CHAT_RATE
+    return stats
+
+
+def get_api_url():
+    return f"{TELEGRAM_API_BASE}/bot{TELEGRAM_BOT_TOKEN}"
+
+
+def _build_client() -> httpx.AsyncClient:
+    http2 = TELEGRAM_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            print("⚠️ h2 not installed, Telegram client falling back to HTTP/1.1")
+            http2 = False
+
+    _stats["clients_created"] += 1
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=TELEGRAM_MAX_CONNECTIONS,
+            max_keepalive_connections=TELEGRAM_MAX_KEEPALIVE,
+            keepalive_expiry=TELEGRAM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(30.0, connect=10.0),
+    )
+
+
+async def open_client() -> httpx.AsyncClient:
+    """Open the shared Telegram client (called from the app lifespan)."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+async def close_client():
+    """Close the shared Telegram client and its pooled connections."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it lazily if the lifespan hasn't run."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+async def _request(method: str, url: str, endpoint: str, **kwargs) -> httpx.Response:
+    """Issue a request on the shared client and keep pool stats up to date."""
+    kwargs.setdefault("timeout", TIMEOUTS.get(endpoint, 30.0))
+    _stats["requests"] += 1
+    _stats["in_flight"] += 1
+    try:
+        return await get_client().request(method, url, **kwargs)
+    except Exception:
+        _stats["errors"] += 1
+        raise
+    finally:
+        _stats["in_flight"] -= 1
+
+
+def get_pool_stats() -> dict:
+    """Request counters plus a snapshot of the shared client's connection pool."""
+    stats = dict(_stats)
+    stats["http2"] = TELEGRAM_HTTP2
+    stats["max_connections"] = TELEGRAM_MAX_CONNECTIONS
+    stats["max_keepalive"] = TELEGRAM_MAX_KEEPALIVE
+    stats["media_registry_entries"] = len(media_registry)
+
+    connections = []
+    if _client is not None and not _client.is_closed:
+        pool = getattr(_client._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+
+    stats["connections"] = len(connections)
+    stats["idle_connections"] = sum(1 for c in connections if c.is_idle())
+    stats["active_connections"] = stats["connections"] - stats["idle_connections"]
+    return stats
+
+
+def _sent_file_id(result: dict) -> str | None:
+    """Extract the file_id Telegram assigned to an uploaded voice note."""
+    message = result.get("result") or {}
+    for kind in ("voice", "audio", "document"):
+        media = message.get(kind)
+        if media and media.get("file_id"):
+            return media["file_id"]
+    return None
+
+
+def _is_file_id_error(result: dict) -> bool:
+    """Whether a failed send was Telegram rejecting the file_id itself."""
+    if result.get("error_code") != 400:
+        return False
+    description = (result.get("description") or "").lower()
+    return any(marker in description for marker in FILE_ID_ERRORS)
+
+
+@instrument("send_voice_message")
+async def send_voice_message(chat_id: str, audio_bytes: bytes, caption: str = None) -> dict:
+    """
+    Send a voice message via Telegram Bot API.
+    Audio we've uploaded before is re-sent by file_id instead of re-uploaded.
+    """
+    data = {"chat_id": chat_id}
+
+    if caption:
+        data["caption"] = caption
+
+    digest = content_hash(audio_bytes)
+    file_id = await media_registry.get(digest)
+
+    if file_id:
+        _stats["voice_reused"] += 1
+        result = await _send("sendVoice", chat_id, json={**data, "voice": file_id})
+        if result.get("ok"):
+            return result
+        if not _is_file_id_error(result):
+            # Blocked chat, rate limit, ... - the file_id is fine, a re-upload wouldn't help
             raise Exception(f"Telegram API error: {result.get('description', 'Unknown error')}")
 
-        return result
+        # file_id was rejected (expired or from another bot) - upload again
+        print(f"Cached voice file_id rejected: {result.get('description')}")
+        await media_registry.forget(digest)
+
+    if is_ogg(audio_bytes):
+        files = {"voice": ("message.ogg", audio_bytes, "audio/ogg")}
+        duration = ogg_opus_duration(audio_bytes)
+        if duration:
+            data["duration"] = max(1, round(duration))
+    else:
+        files = {"voice": ("message.mp3", audio_bytes, "audio/mpeg")}
+    _stats["voice_uploads"] += 1
+    AUDIO_BYTES.observe("telegram_upload", value=len(audio_bytes))
+
+    result = await _send("sendVoice", chat_id, files=files, data=data)
+
+    if not result.get("ok"):
+        raise Exception(f"Telegram API error: {result.get('description', 'Unknown error')}")
+
+    sent_file_id = _sent_file_id(result)
+    if sent_file_id:
+        await media_registry.put(digest, sent_file_id)
 
+    return result
 
+
+@instrument("send_text_message")
 async def send_text_message(chat_id: str, text: str) -> dict:
     """Send a text message via Telegram Bot API."""
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{get_api_url()}/sendMessage",
-            json={
-                "chat_id": chat_id,
-                "text": text,
-            },
-            timeout=30.0
-        )
-
-        result = response.json()
+    result = await _send(
+        "sendMessage",
+        chat_id,
+        json={
+            "chat_id": chat_id,
+            "text": text,
+        },
+    )
 
-        if not result.get("ok"):
-            raise Exception(f"Telegram API error: {result.get('description', 'Unknown error')}")
+    if not result.get("ok"):
+        raise Exception(f"Telegram API error: {result.get('description', 'Unknown error')}")
 
-        return result
+    return result
 
 
+@instrument("send_chat_action")
 async def send_chat_action(chat_id: str, action: str = "record_voice") -> dict:
     """Send a chat action (typing indicator, recording voice, etc.)."""
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{get_api_url()}/sendChatAction",
-            json={
-                "chat_id": chat_id,
-                "action": action,
-            },
-            timeout=10.0
-        )
-        return response.json()
+    response = await _request(
+        "POST",
+        f"{get_api_url()}/sendChatAction",
+        "sendChatAction",
+        json={
+            "chat_id": chat_id,
+            "action": action,
+        },
+    )
+    return response.json()
 
 
+@instrument("set_webhook")
 async def set_webhook(webhook_url: str) -> dict:
     """Set the webhook URL for receiving updates."""
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{get_api_url()}/setWebhook",
-            json={"url": webhook_url},
-            timeout=30.0
-        )
-        return response.json()
+    response = await _request(
+        "POST",
+        f"{get_api_url()}/setWebhook",
+        "setWebhook",
+        json={"url": webhook_url},
+    )
+    return response.json()
 
 
+@instrument("delete_webhook")
 async def delete_webhook() -> dict:
     """Delete the webhook (required for polling mode)."""
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{get_api_url()}/deleteWebhook",
-            timeout=30.0
-        )
-        return response.json()
+    response = await _request(
+        "POST",
+        f"{get_api_url()}/deleteWebhook",
+        "deleteWebhook",
+    )
+    return response.json()
 
 
+@instrument("get_updates")
 async def get_updates(offset: int = None, timeout: int = 30) -> dict:
     """Get updates using long polling."""
-    async with httpx.AsyncClient() as client:
-        params = {"timeout": timeout}
-        if offset:
-            params["offset"] = offset
+    params = {"timeout": timeout}
+    if offset:
+        params["offset"] = offset
 
-        response = await client.post(
-            f"{get_api_url()}/getUpdates",
-            json=params,
-            timeout=timeout + 10  # Add buffer for network latency
-        )
-        return response.json()
+    response = await _request(
+        "POST",
+        f"{get_api_url()}/getUpdates",
+        "getUpdates",
+        json=params,
+        timeout=timeout + 10  # Add buffer for network latency
+    )
+    return response.json()
 
 
+@instrument("get_file")
 async def get_file(file_id: str) -> dict:
     """Get file info from Telegram."""
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{get_api_url()}/getFile",
-            json={"file_id": file_id},
-            timeout=30.0
-        )
-        return response.json()
+    response = await _request(
+        "POST",
+        f"{get_api_url()}/getFile",
+        "getFile",
+        json={"file_id": file_id},
+    )
+    return response.json()
 
 
+@instrument("download_file")
 async def download_file(file_path: str) -> bytes:
     """Download a file from Telegram servers."""
-    file_url = f"https://api.telegram.org/file/bot{TELEGRAM_BOT_TOKEN}/{file_path}"
-    async with httpx.AsyncClient() as client:
-        response = await client.get(file_url, timeout=60.0)
-        if response.status_code != 200:
-            raise Exception(f"Failed to download file: {response.status_code}")
-        return response.content
+    file_url = f"{TELEGRAM_API_BASE}/file/bot{TELEGRAM_BOT_TOKEN}/{file_path}"
+    response = await _request("GET", file_url, "download")
+    if response.status_code != 200:
+        raise Exception(f"Failed to download file: {response.status_code}")
+    return response.content
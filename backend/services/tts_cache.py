@@ -0,0 +1,198 @@
+import os
+import re
+import asyncio
+import hashlib
+from collections import OrderedDict
+
+# In-memory tier: number of clips and total bytes kept hot
+TTS_CACHE_MEMORY_ITEMS = int(os.getenv("TTS_CACHE_MEMORY_ITEMS", "256"))
+TTS_CACHE_MEMORY_BYTES = int(os.getenv("TTS_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024)))
+
+# On-disk tier: directory and total size cap (0 disables the disk tier)
+TTS_CACHE_DIR = os.getenv(
+    "TTS_CACHE_DIR", os.path.join(os.path.dirname(__file__), "..", ".tts_cache")
+)
+TTS_CACHE_DISK_BYTES = int(os.getenv("TTS_CACHE_DISK_BYTES", str(512 * 1024 * 1024)))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so cosmetic differences share a cache entry."""
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def cache_key(voice_id: str, model_id: str, text: str, output_format: str = "") -> str:
+    """Content address for a synthesized clip."""
+    raw = f"{voice_id}\x00{model_id}\x00{output_format}\x00{normalize_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """Two-tier (memory LRU + size-bounded disk) cache of synthesized audio."""
+
+    def __init__(
+        self,
+        directory: str = TTS_CACHE_DIR,
+        memory_items: int = TTS_CACHE_MEMORY_ITEMS,
+        memory_bytes: int = TTS_CACHE_MEMORY_BYTES,
+        disk_bytes: int = TTS_CACHE_DISK_BYTES,
+    ):
+        self.directory = os.path.abspath(directory)
+        self.memory_items = memory_items
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_size = 0
+        self._disk_size: int | None = None
+        self._disk_lock = asyncio.Lock()
+
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+
+    # Memory tier
+
+    def _memory_get(self, key: str) -> bytes | None:
+        audio = self._memory.get(key)
+        if audio is not None:
+            self._memory.move_to_end(key)
+        return audio
+
+    def _memory_put(self, key: str, audio: bytes):
+        if len(audio) > self.memory_bytes:
+            return
+
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old)
+
+        self._memory[key] = audio
+        self._memory_size += len(audio)
+
+        while self._memory and (
+            len(self._memory) > self.memory_items or self._memory_size > self.memory_bytes
+        ):
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+            self.stats["memory_evictions"] += 1
+
+    # Disk tier
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.audio")
+
+    def _disk_read(self, key: str) -> bytes | None:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+        except OSError:
+            return None
+        # Bump mtime so disk eviction is least-recently-used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return audio
+
+    def _scan_disk(self) -> list[tuple[float, int, str]]:
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".audio"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _disk_write(self, key: str, audio: bytes):
+        if self.disk_bytes <= 0 or len(audio) > self.disk_bytes:
+            return
+
+        path = self._path(key)
+        if self._disk_size is None:
+            self._disk_size = sum(size for _, size, _ in self._scan_disk())
+
+        existed = os.path.exists(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
+        if not existed:
+            self._disk_size += len(audio)
+
+        if self._disk_size > self.disk_bytes:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        entries = sorted(self._scan_disk())
+        total = sum(size for _, size, _ in entries)
+        # Trim to 90% of the cap so we don't rescan on every write
+        target = int(self.disk_bytes * 0.9)
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.stats["disk_evictions"] += 1
+        self._disk_size = total
+
+    # Public API
+
+    async def get(self, key: str) -> bytes | None:
+        """Look up a clip, promoting disk hits into memory."""
+        audio = self._memory_get(key)
+        if audio is not None:
+            self.stats["memory_hits"] += 1
+            return audio
+
+        if self.disk_bytes > 0:
+            audio = await asyncio.to_thread(self._disk_read, key)
+            if audio is not None:
+                self.stats["disk_hits"] += 1
+                self._memory_put(key, audio)
+                return audio
+
+        self.stats["misses"] += 1
+        return None
+
+    async def put(self, key: str, audio: bytes):
+        """Store a clip in both tiers."""
+        self.stats["stores"] += 1
+        self._memory_put(key, audio)
+        if self.disk_bytes > 0:
+            async with self._disk_lock:
+                try:
+                    await asyncio.to_thread(self._disk_write, key, audio)
+                except OSError as e:
+                    print(f"TTS cache write error: {e}")
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        stats["memory_items"] = len(self._memory)
+        stats["memory_bytes"] = self._memory_size
+        stats["disk_bytes"] = self._disk_size or 0
+        return stats
+
+
+tts_cache = TTSCache()
@@ -0,0 +1,70 @@
+import os
+
+from services.state import get_state
+
+# How long update_ids are remembered for duplicate detection
+DEDUP_WINDOW_SECONDS = float(os.getenv("DEDUP_WINDOW_SECONDS", str(24 * 60 * 60)))
+
+OFFSET_KEY = "telegram:offset"
+
+
+class UpdateDeduplicator:
+    """
+    Processed Telegram update_ids and the polling offset, kept in the shared
+    state store so every worker sees the same history.
+    """
+
+    def __init__(self, window_seconds: float = DEDUP_WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+
+        self._offset: int | None = None
+        self._dirty = False
+        self.stats = {"accepted": 0, "duplicates": 0}
+
+    async def mark(self, update_id: int) -> bool:
+        """Record an update. Returns False if it was already seen (by any worker)."""
+        fresh = await get_state().set(f"update:{update_id}", "1", ex=self.window_seconds, nx=True)
+        if fresh:
+            self.stats["accepted"] += 1
+        else:
+            self.stats["duplicates"] += 1
+        return fresh
+
+    async def unmark(self, update_id: int):
+        """Forget an update we couldn't accept, so a redelivery is processed."""
+        if await get_state().delete(f"update:{update_id}"):
+            self.stats["accepted"] -= 1
+
+    async def load_offset(self) -> int | None:
+        """The offset to resume polling from (as left by whichever worker polled last)."""
+        stored = await get_state().get(OFFSET_KEY)
+        self._offset = int(stored) if stored is not None else None
+        return self._offset
+
+    @property
+    def offset(self) -> int | None:
+        return self._offset
+
+    def set_offset(self, offset: int):
+        if offset != self._offset:
+            self._offset = offset
+            self._dirty = True
+
+    async def flush(self):
+        """Persist the offset if it changed."""
+        if not self._dirty or self._offset is None:
+            return
+        self._dirty = False
+        try:
+            await get_state().set(OFFSET_KEY, str(self._offset))
+        except Exception as e:
+            self._dirty = True
+            print(f"Update state save error: {e}")
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["offset"] = self._offset
+        return stats
+
+
+update_dedup = UpdateDeduplicator()
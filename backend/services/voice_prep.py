@@ -0,0 +1,141 @@
+"""
+Local checks and clean-up for voice-clone samples before they're uploaded
+to ElevenLabs: duration limits, silence trimming and a length cap.
+"""
+import os
+import time
+import shutil
+import asyncio
+
+from services.audio import is_ogg, ogg_opus_duration, truncate_ogg_opus
+
+# Shortest sample worth cloning (after trimming silence) and the length it's cut to
+CLONE_MIN_SECONDS = float(os.getenv("CLONE_MIN_SECONDS", "10"))
+CLONE_MAX_SECONDS = float(os.getenv("CLONE_MAX_SECONDS", "30"))
+
+# Leading/trailing audio quieter than this is trimmed (needs ffmpeg)
+CLONE_TRIM_SILENCE = os.getenv("CLONE_TRIM_SILENCE", "true").lower() == "true"
+CLONE_SILENCE_THRESHOLD_DB = float(os.getenv("CLONE_SILENCE_THRESHOLD_DB", "-45"))
+CLONE_FFMPEG_TIMEOUT_SECONDS = float(os.getenv("CLONE_FFMPEG_TIMEOUT_SECONDS", "20"))
+
+# Without ffmpeg, samples are only validated and cut at Ogg page boundaries
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY") or shutil.which("ffmpeg")
+
+_stats = {
+    "prepared": 0,
+    "trimmed": 0,
+    "capped": 0,
+    "rejected": 0,
+    "ffmpeg_errors": 0,
+    "seconds_removed": 0.0,
+    "ffmpeg_seconds": 0.0,
+}
+
+
+class VoiceSampleError(Exception):
+    """A sample that can't be cloned; the message is safe to show the user."""
+
+
+def _too_short(seconds: float) -> VoiceSampleError:
+    _stats["rejected"] += 1
+    return VoiceSampleError(
+        f"That recording is only about {seconds:.0f} seconds long - I need at least "
+        f"{CLONE_MIN_SECONDS:.0f} seconds of speech to clone a voice. Please send a voice message of 15-30 seconds, "
+        "speaking clearly and naturally. 🎙️"
+    )
+
+
+def check_declared_duration(duration: float | None):
+    """Reject a voice message from Telegram's reported duration, before downloading it."""
+    if duration is not None and duration < CLONE_MIN_SECONDS:
+        raise _too_short(duration)
+
+
+async def _ffmpeg_trim(audio_bytes: bytes) -> bytes | None:
+    """Trim leading/trailing silence and cap the length, re-encoding to Ogg/Opus."""
+    threshold = f"{CLONE_SILENCE_THRESHOLD_DB:g}dB"
+    trim = f"silenceremove=start_periods=1:start_threshold={threshold}:start_silence=0.2"
+    command = [
+        FFMPEG_BINARY, "-hide_banner", "-loglevel", "error",
+        # Read at most twice the cap, leaving room for leading silence
+        "-t", f"{CLONE_MAX_SECONDS * 2:g}", "-i", "pipe:0",
+        "-af", f"{trim},areverse,{trim},areverse",
+        "-t", f"{CLONE_MAX_SECONDS:g}",
+        "-ac", "1", "-c:a", "libopus", "-b:a", "64k", "-f", "ogg", "pipe:1",
+    ]
+
+    start = time.perf_counter()
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except OSError as e:
+        print(f"ffmpeg unavailable for voice samples: {e}")
+        _stats["ffmpeg_errors"] += 1
+        return None
+
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(audio_bytes), CLONE_FFMPEG_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        print("ffmpeg timed out preparing a voice sample")
+        _stats["ffmpeg_errors"] += 1
+        return None
+    finally:
+        _stats["ffmpeg_seconds"] += time.perf_counter() - start
+
+    if process.returncode != 0 or not stdout:
+        print(f"ffmpeg error preparing a voice sample: {stderr.decode(errors='replace').strip()}")
+        _stats["ffmpeg_errors"] += 1
+        return None
+    return stdout
+
+
+async def prepare_voice_sample(audio_bytes: bytes) -> bytes:
+    """
+    Validate a downloaded sample and return the audio to upload: silence
+    trimmed and capped at CLONE_MAX_SECONDS. Raises VoiceSampleError for
+    samples that are too short or can't be read.
+    """
+    if not audio_bytes:
+        _stats["rejected"] += 1
+        raise VoiceSampleError("I couldn't read that recording. Please try sending the voice message again. 🎙️")
+
+    duration = ogg_opus_duration(audio_bytes) if is_ogg(audio_bytes) else None
+    if duration is not None and duration < CLONE_MIN_SECONDS:
+        raise _too_short(duration)
+
+    if FFMPEG_BINARY and CLONE_TRIM_SILENCE:
+        trimmed = await _ffmpeg_trim(audio_bytes)
+        trimmed_duration = ogg_opus_duration(trimmed) if trimmed else None
+        if trimmed_duration is not None:
+            if trimmed_duration < CLONE_MIN_SECONDS:
+                raise _too_short(trimmed_duration)
+            _stats["prepared"] += 1
+            _stats["trimmed"] += 1
+            if duration is not None:
+                _stats["seconds_removed"] += max(0.0, duration - trimmed_duration)
+            return trimmed
+
+    # No ffmpeg (or it failed): cap the length without re-encoding
+    _stats["prepared"] += 1
+    if duration is not None and duration > CLONE_MAX_SECONDS:
+        try:
+            capped = truncate_ogg_opus(audio_bytes, CLONE_MAX_SECONDS)
+        except ValueError as e:
+            print(f"Voice sample cap error: {e}")
+            return audio_bytes
+        _stats["capped"] += 1
+        _stats["seconds_removed"] += duration - (ogg_opus_duration(capped) or duration)
+        return capped
+    return audio_bytes
+
+
+def get_voice_prep_stats() -> dict:
+    stats = dict(_stats)
+    stats["ffmpeg_available"] = bool(FFMPEG_BINARY)
+    return stats
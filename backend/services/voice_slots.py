@@ -0,0 +1,87 @@
+"""
+Keeps cloned voices within the ElevenLabs account's custom voice slots:
+replaced voices are deleted on re-clone, and the least recently used voices
+are evicted (and their users asked to re-clone) when the account fills up.
+"""
+import os
+import asyncio
+
+from services.elevenlabs import delete_voice
+from services.voice_store import (
+    save_user_voice,
+    get_user_voice,
+    count_user_voices,
+    least_recently_used_voices,
+    mark_voice_evicted,
+)
+
+# Custom voice slots on the ElevenLabs plan (Creator: 30, Pro: 160, ...)
+VOICE_SLOT_CAP = int(os.getenv("VOICE_SLOT_CAP", "30"))
+
+# Free slots kept spare, e.g. for voices created outside the bot
+VOICE_SLOT_HEADROOM = int(os.getenv("VOICE_SLOT_HEADROOM", "2"))
+
+
+def is_slot_limit_error(error: Exception) -> bool:
+    """Whether a clone failed because the account has no voice slots left."""
+    message = str(error).lower()
+    return "voice_limit_reached" in message or "maximum amount of custom voices" in message
+
+
+class VoiceSlotManager:
+    def __init__(self, cap: int = VOICE_SLOT_CAP, headroom: int = VOICE_SLOT_HEADROOM):
+        self.cap = cap
+        self.headroom = headroom
+        # One eviction pass at a time, so concurrent clones don't evict twice for one slot
+        self._lock = asyncio.Lock()
+        self.stats = {"evicted": 0, "replaced_deleted": 0, "delete_errors": 0}
+
+    async def _delete(self, voice_id: str) -> bool:
+        try:
+            await delete_voice(voice_id)
+            return True
+        except Exception as e:
+            print(f"Voice delete error for {voice_id}: {e}")
+            self.stats["delete_errors"] += 1
+            return False
+
+    async def evict(self, count: int, keep: str | None = None) -> int:
+        """Delete the `count` least recently used voices (never `keep`'s). Returns how many went."""
+        evicted = 0
+        for telegram_id, voice_id in least_recently_used_voices(count + 1):
+            if evicted >= count:
+                break
+            if telegram_id == keep:
+                continue
+            if not await self._delete(voice_id):
+                continue
+            mark_voice_evicted(telegram_id)
+            evicted += 1
+            self.stats["evicted"] += 1
+            print(f"🧹 Evicted voice {voice_id} of {telegram_id} (least recently used)")
+        return evicted
+
+    async def ensure_slot(self, telegram_id: str | None = None):
+        """Make room for one more clone, evicting LRU voices once within the headroom of the cap."""
+        async with self._lock:
+            excess = count_user_voices() - (self.cap - self.headroom) + 1
+            # A re-clone frees the voice it replaces, so it doesn't need a new slot
+            if telegram_id and get_user_voice(telegram_id):
+                excess -= 1
+            if excess > 0:
+                await self.evict(excess, keep=telegram_id)
+
+    async def save(self, telegram_id: str, voice_id: str, sample_hash: str | None = None):
+        """Save a user's new voice and delete the one it replaces."""
+        previous = save_user_voice(telegram_id, voice_id, sample_hash)
+        if previous and previous != voice_id and await self._delete(previous):
+            self.stats["replaced_deleted"] += 1
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["cap"] = self.cap
+        stats["held"] = count_user_voices()
+        return stats
+
+
+voice_slots = VoiceSlotManager()
@@ -1,48 +1,343 @@
 import json
 import os
+import sqlite3
+import threading
 from datetime import datetime
 
-VOICES_FILE = os.path.join(os.path.dirname(__file__), "..", "voices.json")
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), "..")
 
+VOICES_FILE = os.path.join(BACKEND_DIR, "voices.json")
+VOICES_DB = os.getenv("VOICES_DB", os.path.join(BACKEND_DIR, "voices.db"))
 
-def _load_voices() -> dict:
-    """Load voices from JSON file."""
-    if os.path.exists(VOICES_FILE):
-        with open(VOICES_FILE, "r") as f:
-            return json.load(f)
-    return {}
+# "sqlite" (default) or "json"
+VOICE_STORE_BACKEND = os.getenv("VOICE_STORE_BACKEND", "sqlite").lower()
 
 
-def _save_voices(voices: dict):
-    """Save voices to JSON file."""
-    with open(VOICES_FILE, "w") as f:
-        json.dump(voices, f, indent=2)
+class JsonVoiceStore:
+    """Voices kept in a JSON file, cached in memory and written atomically."""
 
+    def __init__(self, path: str = VOICES_FILE):
+        self.path = path
+        self._voices: dict | None = None
+        self._lock = threading.Lock()
 
-def save_user_voice(telegram_id: str, voice_id: str):
-    """Save a user's cloned voice ID."""
-    voices = _load_voices()
-    voices[str(telegram_id)] = {
-        "voice_id": voice_id,
-        "created_at": datetime.utcnow().isoformat(),
-    }
-    _save_voices(voices)
+    def _load(self) -> dict:
+        if self._voices is None:
+            if os.path.exists(self.path):
+                with open(self.path, "r") as f:
+                    self._voices = json.load(f)
+            else:
+                self._voices = {}
+        return self._voices
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._voices, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def save(self, telegram_id: str, voice_id: str, sample_hash: str | None = None) -> str | None:
+        with self._lock:
+            voices = self._load()
+            previous = voices.get(telegram_id) or {}
+            now = datetime.utcnow().isoformat()
+            voices[telegram_id] = {
+                "voice_id": voice_id,
+                "created_at": now,
+                "last_used_at": now,
+                "sample_hash": sample_hash,
+            }
+            self._save()
+        if previous.get("voice_id") and not previous.get("evicted_at"):
+            return previous["voice_id"]
+        return None
+
+    def get(self, telegram_id: str) -> str | None:
+        with self._lock:
+            user_data = self._load().get(telegram_id)
+        if user_data and not user_data.get("evicted_at"):
+            return user_data.get("voice_id")
+        return None
+
+    def get_for_sample(self, telegram_id: str, sample_hash: str) -> str | None:
+        with self._lock:
+            user_data = self._load().get(telegram_id)
+        if user_data and not user_data.get("evicted_at") and user_data.get("sample_hash") == sample_hash:
+            return user_data.get("voice_id")
+        return None
+
+    def touch(self, telegram_id: str):
+        with self._lock:
+            user_data = self._load().get(telegram_id)
+            if user_data:
+                user_data["last_used_at"] = datetime.utcnow().isoformat()
+                self._save()
+
+    def count(self) -> int:
+        with self._lock:
+            return sum(1 for data in self._load().values() if not data.get("evicted_at"))
+
+    def least_recently_used(self, limit: int) -> list[tuple[str, str]]:
+        with self._lock:
+            active = [
+                (data.get("last_used_at") or data.get("created_at") or "", telegram_id, data["voice_id"])
+                for telegram_id, data in self._load().items()
+                if not data.get("evicted_at")
+            ]
+        return [(telegram_id, voice_id) for _, telegram_id, voice_id in sorted(active)[:limit]]
+
+    def mark_evicted(self, telegram_id: str):
+        with self._lock:
+            user_data = self._load().get(telegram_id)
+            if user_data:
+                user_data["evicted_at"] = datetime.utcnow().isoformat()
+                self._save()
+
+    def is_evicted(self, telegram_id: str) -> bool:
+        with self._lock:
+            user_data = self._load().get(telegram_id)
+        return bool(user_data and user_data.get("evicted_at"))
+
+    def delete(self, telegram_id: str) -> bool:
+        with self._lock:
+            voices = self._load()
+            if telegram_id in voices:
+                del voices[telegram_id]
+                self._save()
+                return True
+        return False
+
+
+class SQLiteVoiceStore:
+    """
+    Voices kept in SQLite (WAL mode) with an in-process read cache.
+    The cache is dropped whenever another connection commits, so it stays
+    correct when several workers share the database file.
+    """
+
+    def __init__(self, path: str = VOICES_DB, migrate_from: str | None = VOICES_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._cache: dict[str, str | None] = {}
+        self._data_version = None
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS voices (
+                telegram_id TEXT PRIMARY KEY,
+                voice_id TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self._add_usage_columns()
+
+        if migrate_from:
+            self._migrate_json(migrate_from)
+
+    def _add_usage_columns(self):
+        """Usage tracking and sample hash columns, added in place to databases created before them."""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(voices)")}
+        for name in ("last_used_at", "evicted_at", "sample_hash"):
+            if name not in columns:
+                try:
+                    self._conn.execute(f"ALTER TABLE voices ADD COLUMN {name} TEXT")
+                except sqlite3.OperationalError:
+                    # Another worker added it first
+                    pass
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_voices_last_used ON voices (evicted_at, last_used_at)"
+        )
+
+    def _migrate_json(self, json_path: str):
+        """One-shot import of the legacy voices.json file."""
+        with self._lock:
+            done = self._conn.execute(
+                "SELECT value FROM meta WHERE key = 'json_migrated'"
+            ).fetchone()
+            if done or not os.path.exists(json_path):
+                return
+
+            with open(json_path, "r") as f:
+                voices = json.load(f)
+
+            rows = [
+                (str(telegram_id), data["voice_id"], data.get("created_at") or datetime.utcnow().isoformat())
+                for telegram_id, data in voices.items()
+                if data.get("voice_id")
+            ]
+
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO voices (telegram_id, voice_id, created_at) VALUES (?, ?, ?)",
+                    rows,
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)",
+                    (datetime.utcnow().isoformat(),),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+            print(f"📦 Migrated {len(rows)} voices from {os.path.basename(json_path)} to SQLite")
+
+    def _check_cache(self):
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._cache.clear()
+            self._data_version = version
+
+    def save(self, telegram_id: str, voice_id: str, sample_hash: str | None = None) -> str | None:
+        """Store a user's voice, returning the (still active) voice_id it replaces."""
+        now = datetime.utcnow().isoformat()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT voice_id FROM voices WHERE telegram_id = ? AND evicted_at IS NULL", (telegram_id,)
+                ).fetchone()
+                self._conn.execute(
+                    """INSERT OR REPLACE INTO voices
+                    (telegram_id, voice_id, created_at, last_used_at, evicted_at, sample_hash)
+                    VALUES (?, ?, ?, ?, NULL, ?)""",
+                    (telegram_id, voice_id, now, now, sample_hash),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._cache[telegram_id] = voice_id
+        return row[0] if row else None
+
+    def get(self, telegram_id: str) -> str | None:
+        with self._lock:
+            self._check_cache()
+            if telegram_id in self._cache:
+                return self._cache[telegram_id]
+
+            row = self._conn.execute(
+                "SELECT voice_id FROM voices WHERE telegram_id = ? AND evicted_at IS NULL", (telegram_id,)
+            ).fetchone()
+            voice_id = row[0] if row else None
+            self._cache[telegram_id] = voice_id
+            return voice_id
+
+    def get_for_sample(self, telegram_id: str, sample_hash: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT voice_id FROM voices WHERE telegram_id = ? AND sample_hash = ? AND evicted_at IS NULL",
+                (telegram_id, sample_hash),
+            ).fetchone()
+        return row[0] if row else None
+
+    def touch(self, telegram_id: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE voices SET last_used_at = ? WHERE telegram_id = ?",
+                (datetime.utcnow().isoformat(), telegram_id),
+            )
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM voices WHERE evicted_at IS NULL").fetchone()[0]
+
+    def least_recently_used(self, limit: int) -> list[tuple[str, str]]:
+        with self._lock:
+            return self._conn.execute(
+                """SELECT telegram_id, voice_id FROM voices WHERE evicted_at IS NULL
+                ORDER BY COALESCE(last_used_at, created_at) LIMIT ?""",
+                (limit,),
+            ).fetchall()
+
+    def mark_evicted(self, telegram_id: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE voices SET evicted_at = ? WHERE telegram_id = ?",
+                (datetime.utcnow().isoformat(), telegram_id),
+            )
+            self._cache[telegram_id] = None
+
+    def is_evicted(self, telegram_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM voices WHERE telegram_id = ? AND evicted_at IS NOT NULL", (telegram_id,)
+            ).fetchone()
+        return row is not None
+
+    def delete(self, telegram_id: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM voices WHERE telegram_id = ?", (telegram_id,)
+            )
+            self._cache[telegram_id] = None
+            return cursor.rowcount > 0
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the configured voice store, creating it on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if VOICE_STORE_BACKEND == "json":
+                    _store = JsonVoiceStore()
+                else:
+                    _store = SQLiteVoiceStore()
+    return _store
+
+
+def save_user_voice(telegram_id: str, voice_id: str, sample_hash: str | None = None) -> str | None:
+    """Save a user's cloned voice ID. Returns the voice ID it replaced, if any."""
+    return get_store().save(str(telegram_id), voice_id, sample_hash)
+
+
+def get_user_voice_for_sample(telegram_id: str, sample_hash: str) -> str | None:
+    """The user's current voice ID if it was cloned from this exact sample."""
+    return get_store().get_for_sample(str(telegram_id), sample_hash)
 
 
 def get_user_voice(telegram_id: str) -> str | None:
     """Get a user's cloned voice ID, or None if not found."""
-    voices = _load_voices()
-    user_data = voices.get(str(telegram_id))
-    if user_data:
-        return user_data.get("voice_id")
-    return None
+    return get_store().get(str(telegram_id))
 
 
 def delete_user_voice(telegram_id: str) -> bool:
     """Delete a user's cloned voice. Returns True if deleted."""
-    voices = _load_voices()
-    if str(telegram_id) in voices:
-        del voices[str(telegram_id)]
-        _save_voices(voices)
-        return True
-    return False
+    return get_store().delete(str(telegram_id))
+
+
+def touch_user_voice(telegram_id: str):
+    """Record that a user's cloned voice was just used."""
+    get_store().touch(str(telegram_id))
+
+
+def count_user_voices() -> int:
+    """Number of cloned voices currently held (not evicted)."""
+    return get_store().count()
+
+
+def least_recently_used_voices(limit: int) -> list[tuple[str, str]]:
+    """(telegram_id, voice_id) pairs of the least recently used voices, oldest first."""
+    return get_store().least_recently_used(limit)
+
+
+def mark_voice_evicted(telegram_id: str):
+    """Record that a user's voice was deleted remotely to free a slot."""
+    get_store().mark_evicted(str(telegram_id))
+
+
+def was_voice_evicted(telegram_id: str) -> bool:
+    """Whether the user had a voice that was evicted (and hasn't re-cloned since)."""
+    return get_store().is_evicted(str(telegram_id))
@@ -0,0 +1,145 @@
+import os
+import re
+import time
+import random
+import asyncio
+
+from services.openai_service import complete_supportive_response
+from services.elevenlabs import generate_voice_message
+from services.audio import concat_audio
+
+# Pre-generated welcome variants kept per warm recovery type (other types get one)
+WELCOME_POOL_SIZE = int(os.getenv("WELCOME_POOL_SIZE", "3"))
+WELCOME_TTL_SECONDS = float(os.getenv("WELCOME_TTL_SECONDS", str(6 * 60 * 60)))
+WELCOME_MAX_TYPES = int(os.getenv("WELCOME_MAX_TYPES", "50"))
+
+# Recovery types to generate at startup (the deep links used on the website)
+WELCOME_WARM_TYPES = [
+    t.strip() for t in os.getenv("WELCOME_WARM_TYPES", "alcohol,drugs,gambling,smoking").split(",") if t.strip()
+]
+
+WELCOME_PROMPT = """Someone is starting their recovery journey from {recovery_type}. Give them a warm welcome that acknowledges their specific struggle with {recovery_type} and offers encouragement. Keep it under 100 words.
+
+Do not greet them and do not use any name - a greeting with their name is added separately before your words."""
+
+_NON_WORD = re.compile(r"[^a-z ]+")
+
+
+def normalize_recovery_type(raw: str) -> str | None:
+    """Canonical cache key for a deep-link recovery type, or None if unusable."""
+    text = _NON_WORD.sub(" ", raw.lower().replace("_", " ").replace("-", " "))
+    text = " ".join(text.split())[:40]
+    return text or None
+
+
+_POOLED_TYPES = {normalize_recovery_type(t) for t in WELCOME_WARM_TYPES}
+
+
+class WelcomeEntry:
+    def __init__(self, variants: list[bytes]):
+        self.variants = variants
+        self.created_at = time.monotonic()
+        self.next_index = random.randrange(len(variants))
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() - self.created_at < WELCOME_TTL_SECONDS
+
+    def pick(self) -> bytes:
+        audio = self.variants[self.next_index % len(self.variants)]
+        self.next_index += 1
+        return audio
+
+
+class WelcomeCache:
+    """
+    Rotating pools of name-agnostic welcome audio per recovery type. The
+    user's name is spoken as a short, separately synthesized (and cached)
+    greeting in front of the shared body.
+    """
+
+    def __init__(self):
+        self._entries: dict[str, WelcomeEntry] = {}
+        self._fills: dict[str, asyncio.Task] = {}
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "fills": 0, "fill_errors": 0}
+
+    async def _generate_variant(self, recovery_type: str) -> bytes:
+        # Raises on OpenAI failure, so the canned fallback reply is never cached as a welcome
+        text = await complete_supportive_response(
+            WELCOME_PROMPT.format(recovery_type=recovery_type), "friend"
+        )
+        return await generate_voice_message(text)
+
+    async def _fill(self, recovery_type: str) -> WelcomeEntry:
+        # Only the known deep links get a rotating pool; arbitrary /start text costs one generation
+        pool_size = WELCOME_POOL_SIZE if recovery_type in _POOLED_TYPES else 1
+        try:
+            variants = await asyncio.gather(
+                *(self._generate_variant(recovery_type) for _ in range(pool_size))
+            )
+            entry = WelcomeEntry(list(variants))
+            self._entries.pop(recovery_type, None)
+            self._entries[recovery_type] = entry
+            self.stats["fills"] += 1
+
+            # Bound the number of cached types (dicts keep insertion order)
+            while len(self._entries) > WELCOME_MAX_TYPES:
+                del self._entries[next(iter(self._entries))]
+            return entry
+        except Exception:
+            self.stats["fill_errors"] += 1
+            raise
+        finally:
+            self._fills.pop(recovery_type, None)
+
+    def _start_fill(self, recovery_type: str) -> asyncio.Task:
+        """Single-flight: concurrent callers share one fill per type."""
+        task = self._fills.get(recovery_type)
+        if task is None:
+            task = self._fills[recovery_type] = asyncio.create_task(self._fill(recovery_type))
+            # Background refreshes may have no awaiter; errors are counted in stats
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
+    async def get_welcome_body(self, recovery_type: str) -> bytes:
+        """Name-agnostic welcome audio for a (normalized) recovery type."""
+        entry = self._entries.get(recovery_type)
+        if entry is not None:
+            if entry.is_fresh():
+                self.stats["hits"] += 1
+            else:
+                # Serve the stale pool while a fresh one is generated
+                self.stats["stale_hits"] += 1
+                self._start_fill(recovery_type)
+            return entry.pick()
+
+        self.stats["misses"] += 1
+        entry = await asyncio.shield(self._start_fill(recovery_type))
+        return entry.pick()
+
+    async def get_welcome(self, recovery_type: str, first_name: str) -> bytes:
+        """Personalized welcome: "Hey <name>," followed by a pooled body."""
+        greeting, body = await asyncio.gather(
+            generate_voice_message(f"Hey {first_name},"),
+            self.get_welcome_body(recovery_type),
+        )
+        return await asyncio.to_thread(concat_audio, [greeting, body])
+
+    async def warm(self, recovery_types: list[str] = WELCOME_WARM_TYPES):
+        """Pre-generate pools for the common deep links (run at startup)."""
+        for raw in recovery_types:
+            recovery_type = normalize_recovery_type(raw)
+            if not recovery_type or recovery_type in self._entries:
+                continue
+            try:
+                await self._start_fill(recovery_type)
+                print(f"🔥 Warmed welcome pool for {recovery_type}")
+            except Exception as e:
+                print(f"Welcome warm-up error for {recovery_type}: {e}")
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["types"] = len(self._entries)
+        return stats
+
+
+welcome_cache = WelcomeCache()
@@ -0,0 +1,53 @@
+import asyncio
+
+from services import checkins
+from services.checkins import CheckinEngine
+
+
+def test_failed_first_upload_keeps_sends_sequential(monkeypatch):
+    sends = []
+    in_flight = [0, 0]  # current, max
+
+    async def send_voice_message(chat_id, audio_bytes, caption=None):
+        sends.append(chat_id)
+        in_flight[0] += 1
+        in_flight[1] = max(in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            if chat_id == "blocked":
+                raise Exception("Telegram API error: Forbidden: bot was blocked by the user")
+        finally:
+            in_flight[0] -= 1
+
+    monkeypatch.setattr(checkins, "send_voice_message", send_voice_message)
+
+    class Store:
+        disabled = []
+
+        def disable(self, chat_id):
+            self.disabled.append(chat_id)
+            return True
+
+    async def scenario():
+        engine = CheckinEngine(sends_per_second=1000)
+        engine._store = Store()
+        day_audio = asyncio.get_running_loop().create_future()
+        day_audio.set_result(b"audio")
+        engine._audio["2026-10-17"] = day_audio
+
+        for chat_id in ("blocked", "a", "b"):
+            engine._queue.put_nowait((chat_id, "friend", "2026-10-17"))
+        sender = asyncio.create_task(engine._run_sender())
+        while len(sends) < 3:
+            await asyncio.sleep(0.005)
+        await asyncio.sleep(0.02)
+        sender.cancel()
+        return engine
+
+    engine = asyncio.run(scenario())
+    # "a" still uploaded on its own after the blocked chat failed; only then did sends fan out
+    assert sends == ["blocked", "a", "b"]
+    assert in_flight[1] == 1
+    assert engine._uploaded == {"2026-10-17"}
+    assert engine._store.disabled == ["blocked"]
+    assert engine.stats["sent"] == 2
@@ -0,0 +1,66 @@
+import json
+import asyncio
+from types import SimpleNamespace
+
+from services import openai_service
+from services.openai_service import CrisisBatcher
+
+
+class _FakeCompletions:
+    """Answers batches with `batch_reply(ids)` and single checks with "OK"."""
+
+    def __init__(self, batch_reply):
+        self.batch_reply = batch_reply
+        self.singles = 0
+
+    async def create(self, **kwargs):
+        prompt = kwargs["messages"][-1]["content"]
+        if kwargs.get("response_format"):
+            ids = [item["id"] for item in json.loads(prompt.rsplit("Messages:", 1)[1])]
+            content = json.dumps(self.batch_reply(ids))
+        else:
+            self.singles += 1
+            content = "CRISIS" if "bridge" in prompt else "OK"
+        message = SimpleNamespace(content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def _install(monkeypatch, completions):
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    monkeypatch.setattr(openai_service, "get_client", lambda: client)
+
+
+async def _classify_together(batcher, messages):
+    # Hold one check in flight so the rest queue up into a batch
+    batcher._in_flight = 1
+    checks = [asyncio.create_task(batcher.classify(m)) for m in messages]
+    await asyncio.sleep(0)
+    batcher._in_flight = 0
+    batcher._flush()
+    return await asyncio.gather(*checks)
+
+
+def test_batch_verdicts_are_matched_by_id(monkeypatch):
+    # Verdicts returned in reverse order still land on the right messages
+    completions = _FakeCompletions(
+        lambda ids: {"verdicts": {i: ("CRISIS" if n == 0 else "OK") for n, i in reversed(list(enumerate(ids)))}}
+    )
+    _install(monkeypatch, completions)
+    batcher = CrisisBatcher(window_ms=1000, max_size=8)
+
+    results = asyncio.run(_classify_together(batcher, ["on the bridge", "fine", "ok"]))
+    assert results == [True, False, False]
+    assert completions.singles == 0
+
+
+def test_mismatched_ids_fall_back_to_single_checks(monkeypatch):
+    # A reply that forges or drops ids is not trusted for anyone in the batch
+    completions = _FakeCompletions(lambda ids: {"verdicts": {ids[0]: "OK", "forged": "OK"}})
+    _install(monkeypatch, completions)
+    batcher = CrisisBatcher(window_ms=1000, max_size=8)
+
+    results = asyncio.run(_classify_together(batcher, ["on the bridge", "fine"]))
+    assert results == [True, False]
+    assert completions.singles == 2
+    assert batcher.stats["parse_fallbacks"] == 1
+    assert not batcher._runs
@@ -0,0 +1,20 @@
+import asyncio
+
+from services.media_registry import MediaRegistry
+
+
+def test_reused_file_ids_survive_eviction_and_reload(tmp_path):
+    path = str(tmp_path / "media_ids.jsonl")
+
+    async def scenario():
+        registry = MediaRegistry(path, max_entries=3)
+        await registry.put("crisis", "fid_crisis")
+        for i in range(10):
+            assert await registry.get("crisis") == "fid_crisis"
+            await registry.put(f"reply{i}", f"fid_{i}")
+
+        assert await registry.get("reply0") is None
+        reloaded = MediaRegistry(path, max_entries=3)
+        return await reloaded.get("crisis")
+
+    assert asyncio.run(scenario()) == "fid_crisis"
@@ -0,0 +1,116 @@
+import time
+import asyncio
+
+import pytest
+
+from services import resilience
+from services.resilience import CircuitBreaker, CircuitOpenError, call_upstream, HALF_OPEN
+
+
+def _open_breaker(name: str, recovery_seconds: float) -> CircuitBreaker:
+    breaker = resilience._breakers[name] = CircuitBreaker(name, failure_threshold=1, recovery_seconds=recovery_seconds)
+    breaker.record_failure()
+    return breaker
+
+
+def test_cancelled_half_open_trial_releases_the_breaker():
+    breaker = _open_breaker("test_cancel", recovery_seconds=0.05)
+
+    async def scenario():
+        await asyncio.sleep(0.06)
+
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.sleep(10)
+
+        trial = asyncio.create_task(call_upstream("test_cancel", hang, attempts=1))
+        await started.wait()
+        assert breaker.state == HALF_OPEN
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+        async def ok():
+            return "ok"
+
+        return await call_upstream("test_cancel", ok, attempts=1)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert breaker.state == resilience.CLOSED
+
+
+def test_stale_half_open_trial_expires():
+    breaker = _open_breaker("test_stale", recovery_seconds=0.05)
+    time.sleep(0.06)
+
+    assert breaker.allow()  # the trial, which never reports back
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+
+
+def test_open_breaker_rejects_without_calling():
+    _open_breaker("test_open", recovery_seconds=60)
+    calls = []
+
+    async def func():
+        calls.append(1)
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(call_upstream("test_open", func, attempts=1))
+    assert calls == []
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def test_client_errors_fail_fast_without_tripping_the_breaker():
+    breaker = resilience._breakers["test_4xx"] = CircuitBreaker("test_4xx", failure_threshold=2)
+    calls = []
+
+    async def unauthorized():
+        calls.append(1)
+        raise _StatusError(401)
+
+    for _ in range(3):
+        with pytest.raises(_StatusError):
+            asyncio.run(call_upstream("test_4xx", unauthorized, attempts=3))
+    assert len(calls) == 3
+    assert breaker.state == resilience.CLOSED
+    assert breaker.stats["failures"] == 0
+
+
+def test_server_errors_and_timeouts_are_retried_and_counted(monkeypatch):
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt: 0)
+    breaker = resilience._breakers["test_5xx"] = CircuitBreaker("test_5xx", failure_threshold=10)
+    errors = [_StatusError(503), _StatusError(429), TimeoutError()]
+
+    async def flaky():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert asyncio.run(call_upstream("test_5xx", flaky, attempts=4)) == "ok"
+    assert breaker.stats["failures"] == 3
+    assert breaker.state == resilience.CLOSED
+
+
+def test_slow_attempts_time_out_and_are_retried(monkeypatch):
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt: 0)
+    breaker = resilience._breakers["test_slow"] = CircuitBreaker("test_slow", failure_threshold=10)
+    calls = []
+
+    async def slow_then_fast():
+        calls.append(1)
+        if len(calls) == 1:
+            await asyncio.sleep(10)
+        return "ok"
+
+    assert asyncio.run(call_upstream("test_slow", slow_then_fast, attempts=2, timeout=0.05)) == "ok"
+    assert len(calls) == 2
+    assert breaker.stats["failures"] == 1
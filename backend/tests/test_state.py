@@ -0,0 +1,37 @@
+import time
+import asyncio
+
+import pytest
+
+from services.state import MemoryStateStore, SQLiteStateStore, LeaderLock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStateStore()
+    return SQLiteStateStore(str(tmp_path / "state.db"))
+
+
+def test_expired_leader_cannot_overwrite_the_new_one(store):
+    async def scenario():
+        old = LeaderLock(store, "poller", ttl=0.05)
+        new = LeaderLock(store, "poller", ttl=60)
+
+        assert await old.acquire()
+        assert not await new.acquire()
+        time.sleep(0.06)
+
+        assert await new.acquire()
+        # The old leader's renewal must not steal the lock back
+        assert not await old.acquire()
+        assert await store.get(new.key) == new.owner
+
+        await old.release()
+        assert await store.get(new.key) == new.owner
+        assert await new.acquire()
+
+        await new.release()
+        assert await store.get(new.key) is None
+
+    asyncio.run(scenario())